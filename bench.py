@@ -0,0 +1,279 @@
+"""Бенчмарки для note.py.
+
+Запуск:
+    python bench.py run [--sizes 1000,100000,1000000] [--output results.jsonl]
+    python bench.py memory [--items 1000000]
+    python bench.py codecs [--items 100000]
+
+Результаты печатаются таблицей, а с --output дописываются в файл по одной JSON-записи
+на замер, чтобы сравнивать прогоны между собой.
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import note
+import snapshots
+from model import data_from_layout
+from storage import JsonStorage, empty_data, new_id
+
+STATUSES = ("к выполнению", "в процессе", "ожидает", "выполнено", "отменено")
+PRIORITIES = ("высокий", "средний", "низкий")
+
+
+def generate_layout(items, depth=4, fanout=10, task_ratio=0.7, seed=0):
+    """Строит синтетическое дерево в формате файла данных.
+
+    Дерево заполняется по уровням: у каждой заметки до fanout вложенных элементов,
+    доля задач среди них - task_ratio, на глубине depth создаются только задачи.
+    """
+    rng = random.Random(seed)
+    layout = empty_data()
+    count = 0
+
+    def make(is_note):
+        nonlocal count
+        count += 1
+        item = {"id": new_id(), "type": "note" if is_note else "task", "title": f"Элемент {count}",
+                "status": rng.choice(STATUSES), "priority": rng.choice(PRIORITIES)}
+        if is_note:
+            item["content"] = f"Содержимое заметки {count}"
+            item["children"] = []
+        else:
+            item["description"] = f"Описание задачи {count}"
+        return item
+
+    queue = collections.deque()
+    while count < items:
+        if not queue:
+            # Корневой уровень: пополняется, пока есть что добавлять и некуда вкладывать
+            for _ in range(min(fanout, items - count)):
+                item = make(rng.random() >= task_ratio)
+                layout["notes" if item["type"] == "note" else "tasks"].append(item)
+                if item["type"] == "note":
+                    queue.append((item, 1))
+            continue
+        parent, level = queue.popleft()
+        for _ in range(min(fanout, items - count)):
+            item = make(level < depth and rng.random() >= task_ratio)
+            parent["children"].append(item)
+            if item["type"] == "note":
+                queue.append((item, level + 1))
+    return layout
+
+
+def timed(func, repeat=1):
+    """Возвращает среднее время одного вызова func (в секундах)."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def git_revision():
+    """Возвращает текущую ревизию git (или None вне репозитория)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_hot_paths(size, args, rng):
+    """Замеряет основные операции note.py на дереве из size элементов. Возвращает {замер: секунды}."""
+    results = {}
+    JsonStorage(note.DATA_FILE, note.JOURNAL_FILE).save(
+        generate_layout(size, args.depth, args.fanout, args.task_ratio, args.seed))
+
+    # Первый запуск строит поисковый индекс, следующий берет его из файла
+    note.open_storage("json")
+    results["load_data_cold"] = timed(note.load_data)
+    note.close_storage()
+    note.open_storage("json")
+    data = None
+
+    def load():
+        nonlocal data
+        data = note.load_data()
+
+    results["load_data"] = timed(load)
+    results["save_data"] = timed(lambda: note.save_data(data))
+
+    notes = [item for item in note.items_by_id.values() if item.type == "note" and item.children]
+    deep = max(notes, key=lambda item: len(note.get_path(item)), default=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        note.render_cache.clear()
+        results["display_items_root_cold"] = timed(lambda: note.display_items(data["tasks"], page=0))
+        results["display_items_root"] = timed(lambda: note.display_items(data["tasks"], page=0), args.repeat)
+        if deep is not None:
+            results["display_items_nested"] = timed(lambda: note.display_items(deep.children, page=0), args.repeat)
+
+        root_size = len(data["notes"]) + len(data["tasks"])
+        indexes = [str(rng.randint(1, root_size)) for _ in range(args.repeat)]
+        lookups = iter(indexes)
+        results["get_item_by_index"] = timed(lambda: note.get_item_by_index(data, next(lookups)), args.repeat)
+
+        items = rng.sample(list(note.items_by_id.values()), min(args.repeat, size))
+        parents = iter(items)
+        results["parent_lookup"] = timed(lambda: note.get_parent(next(parents)), len(items))
+
+        def delete_random():
+            note.delete_item(data, str(rng.randint(1, len(data["notes"]) + len(data["tasks"]))))
+
+        results["delete_item"] = timed(delete_random, min(args.repeat, root_size))
+        note.commit_changes(data)
+    note.close_storage()
+    return results
+
+
+def run_info(args):
+    """Возвращает сведения о прогоне, которые записываются вместе с каждым замером."""
+    return {"time": datetime.datetime.now().isoformat(timespec="seconds"), "revision": git_revision(),
+            "python": platform.python_version(), "depth": args.depth, "fanout": args.fanout,
+            "task_ratio": args.task_ratio, "seed": args.seed}
+
+
+def bench_run(args):
+    """Замеряет основные операции на деревьях нескольких размеров."""
+    rng = random.Random(args.seed)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    meta = run_info(args)
+    records = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # Файлы данных note.py задаются относительными путями
+        try:
+            for size in sizes:
+                for name, seconds in bench_hot_paths(size, args, rng).items():
+                    records.append({**meta, "benchmark": name, "items": size, "seconds": seconds})
+                    print(f"{size:>9} {name:<26} {seconds * 1000:12.3f} мс")
+        finally:
+            os.chdir(cwd)
+
+    write_results(records, args.output)
+    return records
+
+
+def write_results(records, path):
+    """Дописывает результаты в файл по одной JSON-записи на строку."""
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def measure(build):
+    """Возвращает (результат build(), байт памяти, занятых результатом)."""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return result, used
+
+
+def bench_memory(args):
+    """Сравнивает память на элемент: словари из json.load и объекты Note/Task."""
+    text = json.dumps(generate_layout(args.items, args.depth, args.fanout, args.task_ratio, args.seed),
+                      ensure_ascii=False)
+
+    # Словари в том виде, в каком их возвращает json.load
+    layout, dict_bytes = measure(lambda: json.loads(text))
+    del layout
+
+    # Объекты модели: строки заголовков и id остаются общими с разобранным JSON,
+    # поэтому промежуточные словари удаляются до замера
+    def build_objects():
+        parsed = json.loads(text)
+        return data_from_layout(parsed)
+
+    data, object_bytes = measure(build_objects)
+    del data
+
+    results = {**run_info(args), "benchmark": "memory", "items": args.items,
+               "dict_bytes_per_item": round(dict_bytes / args.items, 1),
+               "object_bytes_per_item": round(object_bytes / args.items, 1),
+               "ratio": round(dict_bytes / object_bytes, 2)}
+    print(f"Элементов: {args.items}")
+    print(f"Словари: {dict_bytes / 2**20:.1f} МБ ({results['dict_bytes_per_item']} байт на элемент)")
+    print(f"Объекты: {object_bytes / 2**20:.1f} МБ ({results['object_bytes_per_item']} байт на элемент)")
+    print(f"Экономия: в {results['ratio']} раза")
+    write_results([results], args.output)
+    return results
+
+
+def bench_codecs(args):
+    """Сравнивает форматы снимка: размер файла, время записи и чтения, чтение одного поддерева."""
+    layout = generate_layout(args.items, args.depth, args.fanout, args.task_ratio, args.seed)
+    meta = run_info(args)
+    target = max(layout["notes"], key=lambda item: item["id"], default=None)  # Произвольная корневая заметка
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for codec in snapshots.available_codecs():
+            storage = JsonStorage(os.path.join(directory, f"notes.{codec}"), codec=codec, generations=0)
+            result = {"codec": codec, "save": timed(lambda: storage.save(layout), args.repeat),
+                      "load": timed(storage.load, args.repeat), "bytes": os.path.getsize(storage.path)}
+            if codec == "binary" and target is not None:
+                result["read_root_item"] = timed(lambda: snapshots.read_root_item(storage.path, target["id"]),
+                                                 args.repeat)
+            records.append({**meta, "benchmark": "codec", "items": args.items, **result})
+
+    baseline = records[0]  # pretty - прежний формат
+    print(f"Элементов: {args.items}")
+    print(f"{'Формат':<10}{'Размер, МБ':>12}{'Запись, мс':>12}{'Чтение, мс':>12}  к pretty (размер / запись / чтение)")
+    for record in records:
+        print(f"{record['codec']:<10}{record['bytes'] / 2**20:12.2f}{record['save'] * 1000:12.1f}"
+              f"{record['load'] * 1000:12.1f}  {record['bytes'] / baseline['bytes']:.2f} / "
+              f"{record['save'] / baseline['save']:.2f} / {record['load'] / baseline['load']:.2f}")
+        if "read_root_item" in record:
+            print(f"{'':<10}одна корневая заметка через оглавление: {record['read_root_item'] * 1000:.3f} мс")
+    write_results(records, args.output)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки note.py.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    tree = argparse.ArgumentParser(add_help=False)  # Параметры синтетического дерева
+    tree.add_argument("--depth", type=int, default=4, help="максимальная глубина вложенности")
+    tree.add_argument("--fanout", type=int, default=10, help="вложенных элементов у заметки")
+    tree.add_argument("--task-ratio", type=float, default=0.7, help="доля задач среди элементов")
+    tree.add_argument("--seed", type=int, default=0, help="зерно генератора случайных чисел")
+    tree.add_argument("--output", metavar="FILE", help="дописать результаты в файл (JSON Lines)")
+
+    run = subparsers.add_parser("run", parents=[tree], help="время основных операций")
+    run.add_argument("--sizes", default="1000,100000,1000000",
+                     help="размеры деревьев через запятую (по умолчанию %(default)s)")
+    run.add_argument("--repeat", type=int, default=1000, help="повторов для быстрых операций")
+    run.set_defaults(run=bench_run)
+
+    memory = subparsers.add_parser("memory", parents=[tree], help="память на элемент: словари против объектов модели")
+    memory.add_argument("--items", type=int, default=1_000_000, help="количество элементов (по умолчанию %(default)s)")
+    memory.set_defaults(run=bench_memory)
+
+    codecs = subparsers.add_parser("codecs", parents=[tree], help="форматы снимка: размер, запись и чтение")
+    codecs.add_argument("--items", type=int, default=100_000, help="количество элементов (по умолчанию %(default)s)")
+    codecs.add_argument("--repeat", type=int, default=3, help="повторов каждого замера")
+    codecs.set_defaults(run=bench_codecs)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""История изменений для отмены и повтора команд.
+
+Шаг истории - одна команда: список ее операций в том виде, в каком их можно выполнить
+в обе стороны:
+    ("add", элемент, родитель)                   - элемент добавлен в конец уровня
+    ("remove", элемент, родитель, позиция)       - элемент удален с позиции
+    ("edit", элемент, прежние поля, новые поля)  - поля в формате файла
+Удаленный элемент хранится тем же объектом, что был в дереве (вместе с вложенными),
+поэтому шаг занимает память пропорционально изменению, а не размеру дерева.
+"""
+import collections
+
+
+class History:
+    """Стеки шагов для отмены и повтора, ограниченные бюджетом.
+
+    Стоимость шага - количество элементов, которые он удерживает (удаленная заметка стоит
+    столько, сколько в ней элементов). Когда суммарная стоимость превышает budget, самые
+    старые шаги забываются.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.undo_steps = collections.deque()  # (описание, операции, стоимость), последний - самый новый
+        self.redo_steps = []
+        self.cost = 0  # Суммарная стоимость шагов в обоих стеках
+        self.paused = False  # Операции отмены и повтора сами в историю не записываются
+        self._operations = []
+        self._operations_cost = 0
+
+    def record(self, operation, cost=1):
+        """Добавляет операцию к текущему шагу."""
+        if not self.paused:
+            self._operations.append(operation)
+            self._operations_cost += cost
+
+    def end_step(self, label):
+        """Завершает шаг команды label.
+
+        Возвращает False, если шаг не поместился в бюджет: тогда история очищается.
+        """
+        if not self._operations:
+            return True
+        step = (label, self._operations, self._operations_cost)
+        self._operations = []
+        self._operations_cost = 0
+        # Новое изменение делает повтор отмененных шагов невозможным
+        self.cost -= sum(cost for _, _, cost in self.redo_steps)
+        self.redo_steps.clear()
+        if step[2] > self.budget:
+            # Более старые шаги могут ссылаться на элементы, которые изменил этот шаг
+            # (например, добавлять задачу в удаленную им заметку): без него их отмена
+            # испортила бы дерево, поэтому история забывается целиком
+            self.undo_steps.clear()
+            self.cost = 0
+            return False
+        self.undo_steps.append(step)
+        self.cost += step[2]
+        while self.cost > self.budget:
+            self.cost -= self.undo_steps.popleft()[2]
+        return True
+
+    def take_undo(self):
+        """Возвращает шаг для отмены (None, если отменять нечего) и переносит его в стек повтора."""
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        return step
+
+    def take_redo(self):
+        """Возвращает шаг для повтора (None, если повторять нечего) и переносит его в стек отмены."""
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step
@@ -0,0 +1,200 @@
+"""Модель данных: компактные классы заметок и задач.
+
+Статус и приоритет хранятся как небольшие целые перечисления, а не как строки, а у
+элементов нет словаря атрибутов (__slots__). В словари формата JSON-файла элементы
+превращаются только на границе с хранилищем (item_to_dict / item_from_dict).
+"""
+import enum
+
+from storage import new_id
+
+
+class Status(enum.IntEnum):
+    """Статус заметки или задачи."""
+
+    TODO = 0
+    IN_PROGRESS = 1
+    WAITING = 2
+    DONE = 3
+    CANCELLED = 4
+
+    @property
+    def label(self):
+        """Название статуса в файле данных и в командах."""
+        return STATUS_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label):
+        """Возвращает статус по названию (None, если такого статуса нет)."""
+        return _STATUS_BY_LABEL.get(label)
+
+
+class Priority(enum.IntEnum):
+    """Приоритет заметки или задачи."""
+
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+
+    @property
+    def label(self):
+        """Название приоритета в файле данных и в командах."""
+        return PRIORITY_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label):
+        """Возвращает приоритет по названию (None, если такого приоритета нет)."""
+        return _PRIORITY_BY_LABEL.get(label)
+
+
+STATUS_LABELS = ("к выполнению", "в процессе", "ожидает", "выполнено", "отменено")
+PRIORITY_LABELS = ("низкий", "средний", "высокий")
+_STATUS_BY_LABEL = {label: Status(value) for value, label in enumerate(STATUS_LABELS)}
+_PRIORITY_BY_LABEL = {label: Priority(value) for value, label in enumerate(PRIORITY_LABELS)}
+
+
+class Note:
+    """Заметка: может содержать вложенные заметки и задачи."""
+
+    __slots__ = ("id", "title", "content", "status", "priority", "children")
+    type = "note"
+
+    def __init__(self, title, content="", status=Status.TODO, priority=Priority.MEDIUM, children=None,
+                 item_id=None):
+        self.id = item_id or new_id()
+        self.title = title
+        self.content = content
+        self.status = status
+        self.priority = priority
+        self.children = [] if children is None else children
+
+    @property
+    def text(self):
+        """Текст заметки (содержимое)."""
+        return self.content
+
+
+class Task:
+    """Задача."""
+
+    __slots__ = ("id", "title", "description", "status", "priority")
+    type = "task"
+
+    def __init__(self, title, description="", status=Status.TODO, priority=Priority.MEDIUM, item_id=None):
+        self.id = item_id or new_id()
+        self.title = title
+        self.description = description
+        self.status = status
+        self.priority = priority
+
+    @property
+    def text(self):
+        """Текст задачи (описание)."""
+        return self.description
+
+
+def walk(items):
+    """Обходит элементы и все вложенные в них элементы (без рекурсии)."""
+    stack = list(reversed(items))
+    while stack:
+        item = stack.pop()
+        yield item
+        if item.type == "note":
+            stack.extend(reversed(item.children))
+
+
+def _from_fields(fields):
+    """Создает элемент (без вложенных) из словаря формата файла."""
+    status = Status.from_label(fields.get("status"))
+    priority = Priority.from_label(fields.get("priority"))
+    if status is None:
+        status = Status.TODO
+    if priority is None:
+        priority = Priority.MEDIUM
+    if fields["type"] == "note":
+        return Note(fields["title"], fields.get("content", ""), status, priority, item_id=fields.get("id"))
+    return Task(fields["title"], fields.get("description", ""), status, priority, item_id=fields.get("id"))
+
+
+def _to_fields(item):
+    """Превращает элемент (без вложенных) в словарь формата файла."""
+    if item.type == "note":
+        return {"id": item.id, "type": "note", "title": item.title, "content": item.content,
+                "status": item.status.label, "priority": item.priority.label}
+    return {"id": item.id, "type": "task", "title": item.title, "description": item.description,
+            "status": item.status.label, "priority": item.priority.label}
+
+
+def item_from_dict(fields):
+    """Создает элемент вместе со всеми вложенными из словаря формата файла."""
+    root = _from_fields(fields)
+    stack = [(root, fields)]
+    while stack:
+        note, source = stack.pop()
+        if note.type != "note":
+            continue
+        for child_fields in source.get("children", ()):
+            child = _from_fields(child_fields)
+            note.children.append(child)
+            stack.append((child, child_fields))
+    return root
+
+
+def item_to_dict(item):
+    """Превращает элемент вместе со всеми вложенными в словарь формата файла."""
+    root = _to_fields(item)
+    stack = [(item, root)]
+    while stack:
+        note, target = stack.pop()
+        if note.type != "note":
+            continue
+        target["children"] = children = []
+        for child in note.children:
+            child_fields = _to_fields(child)
+            children.append(child_fields)
+            stack.append((child, child_fields))
+    return root
+
+
+def data_from_layout(layout):
+    """Превращает данные формата файла ({"notes": [...], "tasks": [...]}) в элементы."""
+    return {"notes": [item_from_dict(fields) for fields in layout["notes"]],
+            "tasks": [item_from_dict(fields) for fields in layout["tasks"]]}
+
+
+def data_to_layout(data):
+    """Превращает элементы обратно в данные формата файла."""
+    return {"notes": [item_to_dict(item) for item in data["notes"]],
+            "tasks": [item_to_dict(item) for item in data["tasks"]]}
+
+
+def iter_records(items, parent_id=None):
+    """Превращает элементы с их вложенными элементами в плоские записи (обход в глубину).
+
+    Каждая запись - поля элемента в формате файла без "children" плюс id родителя и глубина
+    относительно переданного уровня. Родитель всегда идет раньше своих вложенных элементов.
+    """
+    stack = [(iter(items), parent_id)]
+    while stack:
+        children, parent_id = stack[-1]
+        item = next(children, None)
+        if item is None:
+            stack.pop()
+            continue
+        record = _to_fields(item)
+        record["parent"] = parent_id
+        record["depth"] = len(stack) - 1
+        yield record
+        if item.type == "note" and item.children:
+            stack.append((iter(item.children), item.id))
+
+
+def is_item_record(record):
+    """Проверяет, что запись описывает элемент: словарь с id, типом note/task и заголовком."""
+    return (isinstance(record, dict) and isinstance(record.get("id"), str)
+            and record.get("type") in ("note", "task") and isinstance(record.get("title"), str))
+
+
+def record_to_item(record):
+    """Превращает плоскую запись обратно в элемент (без вложенных элементов)."""
+    return _from_fields(record)
@@ -1,5 +1,22 @@
+import argparse
+import atexit
+import cProfile
+import contextlib
+import itertools
 import json
 import os
+import shlex
+import sys
+import time
+
+from model import (PRIORITY_LABELS, STATUS_LABELS, Note, Priority, Status, Task, data_from_layout, data_to_layout,
+                   is_item_record, item_from_dict, item_to_dict, iter_records, record_to_item, walk)
+from history import History
+from profiling import Profiler
+from search import AttributeIndex, SearchIndex
+from snapshots import CODECS, available_codecs
+from storage import (JsonStorage, ShardedStorage, SqliteStorage, migrate_json_to_shards, migrate_json_to_sqlite,
+                     read_ndjson, recovered_path, salvage_file, unused_path, write_ndjson)
 
 # Константы для визуального оформления
 STATUS_TODO = "[К выполнению]"
@@ -38,171 +55,793 @@ except ImportError:
     COLOR_COMPLETED = ""
     COLOR_RESET = ""
 
+# Таблицы для отображения статуса и приоритета (вместо цепочек if/elif на каждую строку),
+# индексируются значениями Status и Priority
+STATUS_DISPLAY = (
+    (STATUS_TODO, COLOR_TODO),
+    (STATUS_IN_PROGRESS, COLOR_IN_PROGRESS),
+    (STATUS_WAITING, COLOR_WAITING),
+    (STATUS_DONE, COLOR_DONE),
+    (STATUS_CANCELLED, COLOR_CANCELLED),
+)
+PRIORITY_DISPLAY = (
+    (PRIORITY_LOW, COLOR_PRIORITY_LOW),
+    (PRIORITY_MEDIUM, COLOR_PRIORITY_MEDIUM),
+    (PRIORITY_HIGH, COLOR_PRIORITY_HIGH),
+)
+COMPLETED_STATUSES = frozenset((Status.DONE, Status.CANCELLED))
+
+PAGE_SIZE = 50  # Количество элементов на одной странице списка
+
 # Имя файла для хранения данных
 DATA_FILE = "notes.json"
+DB_FILE = "notes.db"  # База для хранилища SQLite
+SHARDS_DIR = "notes.shards"  # Каталог хранилища с отдельным файлом на каждую корневую заметку
+
+# Хранилище по умолчанию: "json" (снимок + журнал), "sqlite" или "sharded"
+STORAGE_BACKEND = "json"
+
+# Журнал операций: вместо перезаписи всего файла после каждой команды в журнал
+# дописываются короткие записи, а снимок (DATA_FILE) пересобирается только когда
+# журнал становится слишком большим.
+JOURNAL_FILE = "notes.journal"
+JOURNAL_MODE = True  # False - сохранять весь файл после каждой команды
+JOURNAL_COMPACT_SIZE = 1024 * 1024  # Размер журнала в байтах, после которого делается новый снимок
+
+# Снимок пишется в фоновом потоке через SAVE_DELAY секунд после последнего изменения
+# (None - сразу, в основном потоке). Предыдущие SAVE_GENERATIONS версий файла остаются
+# рядом как notes.json.1, notes.json.2, ... на случай повреждения основного файла.
+SAVE_DELAY = 0.5
+SAVE_GENERATIONS = 3
+
+# Формат снимка DATA_FILE: "pretty" (JSON с отступами), "compact", "orjson" (если
+# установлена библиотека orjson) или "binary". Читается файл в любом из них.
+SNAPSHOT_CODEC = "pretty"
+
+# История для отмены (u) и повтора (r): сколько элементов могут удерживать все хранимые
+# шаги вместе (удаленная заметка стоит столько, сколько в ней элементов)
+UNDO_BUDGET = 100_000
+
+# Сокет сервера (note.py --serve). Пока сервер работает, note.py без параметров
+# подключается к нему, а не загружает данные сам.
+SOCKET_FILE = "notes.sock"
+
+# Поисковый индекс и индекс атрибутов сохраняются рядом с данными, чтобы не строить их
+# заново при запуске (ленивым хранилищам для этого пришлось бы прочитать все данные)
+SEARCH_INDEX_FILE = "notes.index.json"
+ATTRIBUTE_INDEX_FILE = "notes.attributes.json"
+ATTRIBUTE_FIELDS = ("type", "status", "priority")
+# Сводки по заметкам ленивых хранилищ (SQLite считает их рекурсивным запросом по всей базе)
+SUBTREE_COUNTS_FILE = "notes.counts.json"
+
+_storage = None  # Открытое хранилище (None - изменения никуда не записываются)
+profiler = None  # Замеры по фазам (None - выключены, см. enable_profiling)
+NO_PHASE = contextlib.nullcontext()  # Общий пустой контекст: без замеров phase() почти ничего не стоит
+
+# Индекс загруженных элементов: строится один раз при загрузке и обновляется
+# функциями добавления и удаления.
+items_by_id = {}  # id -> элемент
+parent_by_id = {}  # id -> родительская заметка (None для элементов корневого уровня)
+# Кэш отрисованных строк по уровням: ключ уровня -> (список элементов, строки в порядке вывода).
+# Сбрасывается для уровня, только когда меняются его элементы.
+render_cache = {}
+search_index = SearchIndex()  # Полнотекстовый индекс по заголовкам, содержимому и описаниям
+attribute_index = AttributeIndex(ATTRIBUTE_FIELDS)  # Индексы для фильтрации
+# Сводка по содержимому заметок: id заметки -> количество вложенных элементов (на любой
+# глубине) по статусам, затем по приоритетам. Обновляется вдоль пути к корню при каждом
+# изменении, а не пересчитывается при отрисовке.
+subtree_counts = {}
+COUNTS_SIZE = len(Status) + len(Priority)
+history = History(UNDO_BUDGET)  # Шаги для отмены и повтора команд
+
+
+def open_storage(backend=STORAGE_BACKEND, codec=SNAPSHOT_CODEC):
+    """Открывает хранилище выбранного типа (codec - формат снимка для хранилища json)."""
+    global _storage
+    if backend == "sqlite":
+        _storage = SqliteStorage(DB_FILE)
+    elif backend == "sharded":
+        _storage = ShardedStorage(SHARDS_DIR)
+    else:
+        if codec not in available_codecs():
+            print(f"Предупреждение: Формат снимка '{codec}' недоступен (не установлен orjson?), используется compact.")
+            codec = "compact"
+        _storage = JsonStorage(DATA_FILE, JOURNAL_FILE if JOURNAL_MODE else None, JOURNAL_COMPACT_SIZE,
+                               SAVE_GENERATIONS, SAVE_DELAY, codec)
+    if profiler is not None:
+        _storage.on_write = profiler.record_save
+    return _storage
+
+
+def enable_profiling(cprofile_path=None):
+    """Включает замеры по фазам, а с cprofile_path - еще и cProfile всей сессии (файл пишется при выходе)."""
+    global profiler
+    profiler = Profiler()
+    if _storage is not None:
+        _storage.on_write = profiler.record_save
+    if cprofile_path:
+        session_profile = cProfile.Profile()
+        session_profile.enable()
+
+        def dump():
+            session_profile.disable()
+            session_profile.dump_stats(cprofile_path)
+            print(f"Профиль сессии записан в {cprofile_path} (python -m pstats {cprofile_path}).")
+
+        atexit.register(dump)
+
+
+def phase(name):
+    """Возвращает контекст замера фазы name (пустой, если замеры выключены)."""
+    return NO_PHASE if profiler is None else profiler.phase(name)
+
+
+def print_stats():
+    """Выводит отчет о замерах по фазам."""
+    if profiler is None:
+        print("Ошибка: Замеры выключены. Запустите note.py с --profile.")
+        return
+    if not profiler.samples:
+        print("Замеров пока нет.")
+        return
+    print("\n".join(profiler.report()))
+
+
+def storage_lock():
+    """Блокировка, под которой меняются данные (фоновое сохранение строит снимок под ней же)."""
+    return _storage.lock if _storage is not None else contextlib.nullcontext()
+
+
+def close_storage():
+    """Дописывает отложенные изменения, закрывает хранилище и сохраняет индексы."""
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        stamp = _storage.stamp()
+        search_index.save(SEARCH_INDEX_FILE, stamp)
+        attribute_index.save(ATTRIBUTE_INDEX_FILE, stamp)
+        if _storage.lazy:
+            save_subtree_counts(SUBTREE_COUNTS_FILE, stamp)
+        _storage = None
 
 
 def load_data():
-    """Загружает данные из файла JSON."""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r", encoding="utf-8") as f:  # Указываем кодировку utf-8 при чтении
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                print("Ошибка: Файл данных поврежден. Начинаем с пустой структуры.")
-                return {"notes": [], "tasks": []}
-    else:
-        return {"notes": [], "tasks": []}
+    """Загружает данные из хранилища и строит индекс элементов."""
+    if _storage is None:
+        open_storage()
+    data = data_from_layout(_storage.load())
+    build_index(data)
+    load_search_index(data)
+    build_attribute_index(data)
+    build_subtree_counts(data)
+    return data
 
 
 def save_data(data):
-    """Сохраняет данные в файл JSON."""
-    with open(DATA_FILE, "w", encoding="utf-8") as f:  # Указываем кодировку utf-8 при записи
-        json.dump(data, f, indent=4, ensure_ascii=False)  # ensure_ascii=False для корректного отображения кириллицы
+    """Полностью сохраняет данные в хранилище."""
+    if _storage is None:
+        open_storage()
+    _storage.save(data_to_layout(data))
+
+
+def log_operation(record):
+    """Передает запись об операции хранилищу."""
+    if _storage is not None:
+        _storage.record(record)
 
 
-def display_items(items, level=0):
-    """Отображает список задач и заметок."""
-    active_items = []
-    completed_items = []
+class DataSnapshot:
+    """Снимок данных для хранилища, который строится только при необходимости.
+
+    Вызов возвращает весь снимок в формате файла, а хранилище, которое пишет данные по
+    частям, берет только нужное: одну корневую заметку или корневые задачи.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __call__(self):
+        return data_to_layout(self.data)
+
+    def note(self, note_id):
+        """Корневая заметка со всеми вложенными элементами."""
+        return item_to_dict(items_by_id[note_id])
+
+    def tasks(self):
+        """Корневые задачи."""
+        return [item_to_dict(task) for task in self.data["tasks"]]
+
+    def note_ids(self):
+        """id корневых заметок по порядку."""
+        return [note.id for note in self.data["notes"]]
+
+
+def commit_changes(data):
+    """Фиксирует изменения после команды."""
+    if _storage is not None:
+        _storage.commit(DataSnapshot(data))
+
+
+def load_children(note):
+    """Дочитывает вложенные элементы заметки, если хранилище загружает их по требованию."""
+    if _storage is not None and _storage.lazy:
+        for fields in _storage.load_children(note.id):
+            child = item_from_dict(fields)
+            note.children.append(child)
+            register_item(child, note)
+            if child.type == "note" and child.id not in subtree_counts:
+                count_subtree(child)  # Хранилище не дало сводку: все содержимое заметки уже прочитано
+        render_cache.pop(note.id, None)
+
+
+def load_subtree(item):
+    """Дочитывает все вложенные элементы заметки на любой глубине."""
+    for node in walk([item]):
+        if node.type == "note":
+            load_children(node)
+
+
+def build_index(data):
+    """Строит индекс id -> элемент и id -> родитель для всех загруженных элементов."""
+    items_by_id.clear()
+    parent_by_id.clear()
+    for item in data["notes"] + data["tasks"]:
+        register_item(item, None)
+
+
+def register_item(item, parent):
+    """Добавляет в индекс элемент и все вложенные в него элементы."""
+    items_by_id[item.id] = item
+    parent_by_id[item.id] = parent
+    for node in walk([item]):
+        if node.type == "note":
+            for child in node.children:
+                items_by_id[child.id] = child
+                parent_by_id[child.id] = node
+
+
+def unregister_item(item):
+    """Удаляет из индекса элемент и все вложенные в него элементы."""
+    for node in walk([item]):
+        items_by_id.pop(node.id, None)
+        parent_by_id.pop(node.id, None)
+
+
+def item_added(item, parent, position=None):
+    """Добавляет новый элемент в индексы и записывает операцию в журнал.
+
+    position - место элемента в списке уровня, если он вставлен не в конец.
+    """
+    register_item(item, parent)
+    invalidate_level(item)
+    for node in walk([item]):
+        search_index.add(node.id, item_text(node))
+        attribute_index.add(node.id, node)
+    count_subtree(item)
+    adjust_ancestors(item, item_counts(item))
+    op = {"op": "add", "parent": parent.id if parent else None, "item": item_to_dict(item)}
+    if position is not None:
+        op["position"] = position
+    log_operation(op)
+    history.record(("add", item, parent))
+
+
+def item_removed(item, position):
+    """Удаляет элемент, стоявший на месте position, из индексов и записывает операцию в журнал."""
+    # Для отмены удаления элемент нужен целиком, а хранилище удалит его вместе с содержимым
+    load_subtree(item)
+    log_operation({"op": "delete", "id": item.id})
+    invalidate_level(item)
+    adjust_ancestors(item, [-count for count in item_counts(item)])
+    parent = get_parent(item)
+    unregister_item(item)
+    removed = 0
+    for node in walk([item]):
+        search_index.remove(node.id)
+        attribute_index.remove(node.id)
+        subtree_counts.pop(node.id, None)
+        removed += 1
+    history.record(("remove", item, parent, position), removed)
+
+
+def item_edited(item, changes, before):
+    """Записывает измененные поля элемента (в формате файла) в журнал и обновляет индексы.
+
+    before - значения полей до правки (в том же формате).
+    """
+    if not changes:
+        return
+    log_operation({"op": "edit", "id": item.id, "fields": changes})
+    history.record(("edit", item, {field: before[field] for field in changes}, dict(changes)))
+    invalidate_level(item)
+    if {"title", "content", "description"} & changes.keys():
+        search_index.add(item.id, item_text(item))
+    if {"status", "priority"} & changes.keys():
+        # Прежние статус и приоритет еще лежат в индексе атрибутов
+        before = dict(zip(attribute_index.fields, attribute_index.values[item.id]))
+        delta = [0] * COUNTS_SIZE
+        delta[before["status"]] -= 1
+        delta[len(Status) + before["priority"]] -= 1
+        delta[item.status] += 1
+        delta[len(Status) + item.priority] += 1
+        adjust_ancestors(item, delta)
+        attribute_index.add(item.id, item)
+
+
+def item_text(item):
+    """Возвращает текст элемента для поиска."""
+    return f"{item.title} {item.text}"
+
+
+def load_search_index(data):
+    """Загружает сохраненный поисковый индекс или строит его заново, если он устарел."""
+    global search_index
+    stamp = _storage.stamp() if _storage is not None else None
+    saved = SearchIndex.load(SEARCH_INDEX_FILE, stamp) if stamp is not None else None
+    if saved is not None:
+        search_index = saved
+        return
+    search_index = SearchIndex.build((item.id, item_text(item)) for item in iter_all_items(data))
+
+
+def build_attribute_index(data):
+    """Загружает сохраненные индексы по типу, статусу и приоритету или строит их заново, если они устарели."""
+    global attribute_index
+    stamp = _storage.stamp() if _storage is not None else None
+    saved = AttributeIndex.load(ATTRIBUTE_INDEX_FILE, stamp, ATTRIBUTE_FIELDS) if stamp is not None else None
+    if saved is not None:
+        attribute_index = saved
+        return
+    attribute_index = AttributeIndex(ATTRIBUTE_FIELDS)
+    for item in iter_all_items(data):
+        attribute_index.add(item.id, item)
+
+
+def item_counts(item):
+    """Возвращает вклад элемента в сводку родителя: он сам плюс все его вложенные элементы."""
+    counts = list(subtree_counts.get(item.id, ())) or [0] * COUNTS_SIZE
+    counts[item.status] += 1
+    counts[len(Status) + item.priority] += 1
+    return counts
+
+
+def count_subtree(item):
+    """Заново считает сводки для заметок внутри элемента (от вложенных к внешним)."""
+    for node in reversed(list(walk([item]))):
+        if node.type == "note":
+            counts = [0] * COUNTS_SIZE
+            for child in node.children:
+                counts[child.status] += 1
+                counts[len(Status) + child.priority] += 1
+                nested = subtree_counts.get(child.id)
+                if nested is not None:
+                    for i, count in enumerate(nested):
+                        counts[i] += count
+            subtree_counts[node.id] = counts
+
+
+def save_subtree_counts(path, stamp):
+    """Сохраняет сводки в файл вместе с отметкой о состоянии данных."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"stamp": stamp, "size": COUNTS_SIZE, "counts": subtree_counts}, f)
+
+
+def load_subtree_counts(path, stamp):
+    """Загружает сводки из файла. Возвращает None, если файла нет или он устарел."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if saved.get("stamp") != stamp or saved.get("size") != COUNTS_SIZE:
+        return None
+    return saved["counts"]
+
 
+def build_subtree_counts(data):
+    """Считает сводки для всех заметок при загрузке."""
+    subtree_counts.clear()
+    if _storage is not None and _storage.lazy:
+        saved = load_subtree_counts(SUBTREE_COUNTS_FILE, _storage.stamp())
+        if saved is not None:
+            subtree_counts.update(saved)
+            return
+        # Вложенные элементы еще не прочитаны: сводки считает хранилище
+        for note_id, status, priority, count in _storage.subtree_counts():
+            counts = subtree_counts.setdefault(note_id, [0] * COUNTS_SIZE)
+            status = Status.from_label(status)
+            priority = Priority.from_label(priority)
+            if status is None:
+                status = Status.TODO
+            if priority is None:
+                priority = Priority.MEDIUM
+            counts[status] += count
+            counts[len(Status) + priority] += count
+        return
+    for item in data["notes"]:
+        count_subtree(item)
+
+
+def adjust_ancestors(item, delta):
+    """Прибавляет delta к сводкам всех заметок, в которые вложен элемент."""
+    parent = parent_by_id.get(item.id)
+    while parent is not None:
+        counts = subtree_counts.setdefault(parent.id, [0] * COUNTS_SIZE)
+        for i, change in enumerate(delta):
+            counts[i] += change
+        invalidate_level(parent)  # Сводка выводится в строке заметки
+        parent = parent_by_id.get(parent.id)
+
+
+def format_counts(counts):
+    """Возвращает сводку заметки для строки списка (пустую, если заметка пуста)."""
+    total = sum(counts[:len(Status)])
+    if not total:
+        return ""
+    statuses = ", ".join(f"{label} {count}" for label, count in zip(STATUS_LABELS, counts) if count)
+    priorities = ", ".join(f"{label} {count}" for label, count in zip(PRIORITY_LABELS, counts[len(Status):]) if count)
+    summary = f"{total} эл.: {statuses}; {priorities}"
+    considered = total - counts[Status.CANCELLED]  # Отмененное не считается ни сделанным, ни оставшимся
+    if considered:
+        summary += f"; готово {counts[Status.DONE] * 100 // considered}%"
+    return f" [{summary}]"
+
+
+def iter_all_items(data):
+    """Обходит все элементы, включая еще не загруженные из хранилища (для построения индексов)."""
+    if _storage is not None and _storage.lazy:
+        return (record_to_item(fields) for fields in _storage.iter_items())
+    return walk(data["notes"] + data["tasks"])
+
+
+def find_item(item_id):
+    """Возвращает элемент по id, при необходимости дочитывая из хранилища заметки на пути к нему."""
+    if item_id not in items_by_id and _storage is not None and _storage.lazy:
+        for ancestor_id in _storage.ancestors(item_id):
+            if ancestor_id not in items_by_id:
+                break
+            load_children(items_by_id[ancestor_id])
+    return items_by_id.get(item_id)
+
+
+def is_inside(item_id, note):
+    """Проверяет по id, вложен ли элемент в заметку, не дочитывая уровни на пути к нему."""
+    if item_id in items_by_id:
+        parent = parent_by_id.get(item_id)
+        while parent is not None:
+            if parent is note:
+                return True
+            parent = parent_by_id.get(parent.id)
+        return False
+    if _storage is not None and _storage.lazy:
+        return note.id in _storage.ancestors(item_id)
+    return False
+
+
+def search_items(query):
+    """Ищет элементы по словам (или началам слов) и выводит их с полным путем."""
+    print_found(search_index.search(query))
+
+
+# Допустимые значения для фильтра (подчеркивание в команде заменяет пробел)
+FILTER_VALUES = {
+    "type": {"note": "note", "task": "task", "заметка": "note", "задача": "task"},
+    "status": {status.label: status for status in Status},
+    "priority": {priority.label: priority for priority in Priority},
+}
+
+
+def filter_items(args, context=None):
+    """Выводит элементы всего дерева (или поддерева context), подходящие под условия.
+
+    Условия задаются как поле=значение[,значение...], например status=в_процессе priority=высокий.
+    Слово here ограничивает поиск текущей заметкой.
+    """
+    conditions = {}
+    subtree = None
+    for arg in args:
+        if arg == "here":
+            subtree = context
+            continue
+        field, _, values = arg.partition("=")
+        if field not in FILTER_VALUES or not values:
+            print(f"Ошибка: Неверное условие '{arg}'. Используйте type=, status=, priority= и here.")
+            return
+        allowed = set()
+        for value in values.replace("_", " ").split(","):
+            if value not in FILTER_VALUES[field]:
+                print(f"Ошибка: Недопустимое значение '{value}' для {field}. "
+                      f"Допустимые значения: {', '.join(FILTER_VALUES[field])}.")
+                return
+            allowed.add(FILTER_VALUES[field][value])
+        conditions.setdefault(field, set()).update(allowed)
+    if not conditions:
+        print("Ошибка: Укажите хотя бы одно условие.")
+        return
+
+    ids = attribute_index.query(conditions)
+    if subtree is not None:
+        ids = {item_id for item_id in ids if is_inside(item_id, subtree)}
+    print_found(ids)
+
+
+def export_items(items, path, parent=None):
+    """Выгружает элементы с вложенными элементами в NDJSON-файл (одна запись на строку)."""
     for item in items:
-        if item["type"] == "task" and item["status"] in ("выполнено", "отменено"):
-            completed_items.append(item)
+        load_subtree(item)
+    count = write_ndjson(iter_records(items, parent.id if parent else None), path)
+    print(f"Выгружено элементов: {count} в {path}.")
+
+
+def archive_items(data, path):
+    """Дописывает все выполненные и отмененные элементы (с их вложенными) в файл и удаляет их из дерева."""
+    ids = attribute_index.query({"status": COMPLETED_STATUSES})
+    archived = []
+    for item_id in ids:
+        item = find_item(item_id)
+        # Элемент внутри уже архивируемой заметки уйдет вместе с ней
+        if item is not None and not any(node.id in ids for node in get_path(item)[:-1]):
+            archived.append(item)
+    if not archived:
+        print("Нет выполненных или отмененных элементов.")
+        return
+
+    for item in archived:
+        load_subtree(item)
+    records = itertools.chain.from_iterable(
+        iter_records([item], get_parent(item).id if get_parent(item) else None) for item in archived)
+    count = write_ndjson(records, path, append=True)
+    for item in archived:
+        remove_item(data, item)
+    print(f"В архив {path} перенесено элементов: {count}.")
+
+
+def import_items(data, path, parent=None):
+    """Загружает элементы из NDJSON-файла в текущий уровень, читая файл построчно.
+
+    Элементы, id которых уже есть в дереве, пропускаются (их вложенные элементы при этом
+    добавляются к уже существующим), поэтому выгрузки с разных машин можно сливать.
+    Элементы, родителя которых нет ни в файле, ни в дереве, попадают в parent. Записи, не
+    описывающие элемент (другой JSON в файле), пропускаются и подсчитываются.
+    """
+    added = skipped = invalid = 0
+    for record in read_ndjson(path):
+        if not is_item_record(record):
+            invalid += 1
+            continue
+        if record["id"] in attribute_index:
+            skipped += 1
+            continue
+        target = parent
+        if isinstance(record.get("parent"), str):
+            existing = find_item(record["parent"])
+            if existing is not None and existing.type == "note":
+                target = existing
+        item = record_to_item(record)
+        if target is None:
+            data["notes" if item.type == "note" else "tasks"].append(item)
         else:
-            active_items.append(item)
+            load_children(target)
+            target.children.append(item)
+        item_added(item, target)
+        added += 1
+    print(f"Загружено элементов: {added}, пропущено уже существующих: {skipped}.")
+    if invalid:
+        print(f"Предупреждение: Пропущено записей, не похожих на элементы: {invalid}.")
+
+
+def print_found(ids):
+    """Выводит найденные элементы с полным путем."""
+    found = [find_item(item_id) for item_id in ids]
+    found = [item for item in found if item is not None]
+    if not found:
+        print("Ничего не найдено.")
+        return
+
+    results = []
+    for item in found:
+        path = " / ".join(node.title for node in get_path(item))
+        status_str, color = get_status_display(item.status)
+        kind = "Заметка" if item.type == "note" else "Задача"
+        results.append(f"{kind}: {path} {color}{status_str}{COLOR_RESET}")
+    results.sort()
+    print(f"Найдено: {len(results)}")
+    for i, line in enumerate(results):
+        print(f"{i+1}. {line}")
+
+
+def get_parent(item):
+    """Возвращает родительскую заметку элемента (None для корневого уровня)."""
+    return parent_by_id.get(item.id)
+
+
+def get_path(item):
+    """Возвращает цепочку заметок от корня до элемента включительно."""
+    path = []
+    while item is not None:
+        path.append(item)
+        item = get_parent(item)
+    path.reverse()
+    return path
 
-    all_items = active_items + completed_items # сначала активные, потом завершенные
 
-    for i, item in enumerate(all_items):
-        prefix = "  " * level + f"{i+1}. "
-        if item["type"] == "task":
-            status_str, color = get_status_display(item["status"])
-            priority_str, priority_color = get_priority_display(item["priority"])
-            item_color = get_item_color(item["priority"], item["status"])  # получаем цвет для всего элемента
+def get_container(data, item):
+    """Возвращает список, в котором лежит элемент."""
+    parent = get_parent(item)
+    if parent is not None:
+        return parent.children
+    return data["notes"] if item.type == "note" else data["tasks"]
 
-            print(f"{prefix}{item_color}{status_str} {item['title']} {priority_str}{COLOR_RESET}")
-        elif item["type"] == "note":
-            status_str, color = get_status_display(item["status"])
-            priority_str, priority_color = get_priority_display(item["priority"])
-            item_color = get_item_color(item["priority"], item["status"])  # получаем цвет для всего элемента
 
-            print(f"{prefix}{item_color}{status_str} {item['title']} {priority_str}{COLOR_RESET}")
+def display_items(items, level=0, page=None):
+    """Отображает список задач и заметок (или одну его страницу) одной записью в stdout."""
+    with phase("render"):
+        rows = render_rows(items)
+        start = 0 if page is None else page * PAGE_SIZE
+        end = len(rows) if page is None else start + PAGE_SIZE
+        indent = "  " * level
+        sys.stdout.write("".join(f"{indent}{i+1}. {row}\n" for i, row in enumerate(rows[start:end], start)))
+
+
+def page_count(items):
+    """Возвращает количество страниц в списке."""
+    return max(1, (len(items) + PAGE_SIZE - 1) // PAGE_SIZE)
+
+
+def level_key(item):
+    """Возвращает ключ уровня, на котором лежит элемент (для кэша отрисовки)."""
+    parent = get_parent(item)
+    if parent is not None:
+        return parent.id
+    return "notes" if item.type == "note" else "tasks"
+
+
+def invalidate_level(item):
+    """Сбрасывает кэш отрисовки уровня, на котором лежит элемент."""
+    render_cache.pop(level_key(item), None)
+
+
+def render_rows(items):
+    """Возвращает строки списка: сначала активные элементы, потом завершенные.
+
+    Результат кэшируется для уровня и пересчитывается только после его изменения.
+    """
+    if not items:
+        return []
+    key = level_key(items[0])
+    cached = render_cache.get(key)
+    if cached is not None and cached[0] is items:
+        return cached[1]
+
+    active_rows = []
+    completed_rows = []
+    for item in items:
+        status_str, _ = STATUS_DISPLAY[item.status]
+        priority_str, _ = PRIORITY_DISPLAY[item.priority]
+        item_color = get_item_color(item.priority, item.status)  # получаем цвет для всего элемента
+        row = f"{item_color}{status_str} {item.title} {priority_str}{COLOR_RESET}"
+        if item.type == "note" and item.id in subtree_counts:
+            row += format_counts(subtree_counts[item.id])
+        if item.type == "task" and item.status in COMPLETED_STATUSES:
+            completed_rows.append(row)
+        else:
+            active_rows.append(row)
+
+    rows = active_rows + completed_rows  # сначала активные, потом завершенные
+    render_cache[key] = (items, rows)
+    return rows
 
 
 def get_status_display(status):
     """Возвращает строку статуса и цвет в зависимости от статуса элемента (задачи или заметки)."""
-    if status == "к выполнению":
-        return STATUS_TODO, COLOR_TODO
-    elif status == "в процессе":
-        return STATUS_IN_PROGRESS, COLOR_IN_PROGRESS
-    elif status == "ожидает":
-        return STATUS_WAITING, COLOR_WAITING
-    elif status == "выполнено":
-        return STATUS_DONE, COLOR_DONE
-    elif status == "отменено":
-        return STATUS_CANCELLED, COLOR_CANCELLED
-    else:
-        return "[Неизвестный статус]", ""  # Default case
+    return STATUS_DISPLAY[status]
 
 
 def get_priority_display(priority):
     """Возвращает строку приоритета и цвет в зависимости от приоритета элемента (задачи или заметки)."""
-    if priority == "высокий":
-        return PRIORITY_HIGH, COLOR_PRIORITY_HIGH
-    elif priority == "средний":
-        return PRIORITY_MEDIUM, COLOR_PRIORITY_MEDIUM
-    elif priority == "низкий":
-        return PRIORITY_LOW, COLOR_PRIORITY_LOW
-    else:
-        return "(Неизвестный приоритет)", ""  # Default case
+    return PRIORITY_DISPLAY[priority]
 
 
 def get_item_color(priority, status):
     """Возвращает цвет элемента в зависимости от его приоритета и статуса."""
-    if status in ("выполнено", "отменено"):
+    if status in COMPLETED_STATUSES:
         return COLOR_COMPLETED
-    elif priority == "высокий":
-        return COLOR_PRIORITY_HIGH
-    elif priority == "средний":
-        return COLOR_PRIORITY_MEDIUM
-    elif priority == "низкий":
-        return COLOR_PRIORITY_LOW
-    else:
-        return ""  # Default case
+    return PRIORITY_DISPLAY[priority][1]
 
 
 def display_note_content(note):
     """Отображает содержимое заметки (включая вложенные элементы)."""
-    if "content" in note and note["content"]:
-        print(f"\nСодержимое заметки: {note['content']}\n")
+    if note.content:
+        print(f"\nСодержимое заметки: {note.content}\n")
 
-    if "children" in note and note["children"]:
+    if note.children:
         print("Вложенные элементы:")
-        display_items(note["children"], level=1)
+        display_items(note.children, level=1)
 
 
 def add_note(data, title, parent=None):
     """Добавляет новую заметку."""
-    new_note = {"type": "note", "title": title, "content": "", "children": [], "status": "к выполнению",
-                "priority": "средний"}  # Добавлены статус и приоритет по умолчанию
+    new_note = Note(title)  # Статус "к выполнению" и приоритет "средний" по умолчанию
     if parent is None:
         data["notes"].append(new_note)
     else:
-        parent["children"].append(new_note)
+        parent.children.append(new_note)
+    item_added(new_note, parent)
     print(f"Заметка '{title}' добавлена.")
 
 
 def add_task(data, title, description, parent=None):
     """Добавляет новую задачу."""
-    new_task = {"type": "task", "title": title, "description": description, "status": "к выполнению",
-                "priority": "средний"}  # Добавлен приоритет по умолчанию
+    new_task = Task(title, description)  # Статус "к выполнению" и приоритет "средний" по умолчанию
     if parent is None:
         data["tasks"].append(new_task)
     else:
-        parent["children"].append(new_task)
+        parent.children.append(new_task)
+    item_added(new_task, parent)
     print(f"Задача '{title}' добавлена.")
 
 
 def edit_note(note, new_title=None, new_content=None, new_status=None, new_priority=None):
     """Редактирует заголовок, содержимое, статус и/или приоритет заметки."""
+    before = {"title": note.title, "content": note.content, "status": note.status.label,
+              "priority": note.priority.label}
+    changes = {}  # Примененные изменения (для журнала)
     if new_title:
-        note["title"] = new_title
+        note.title = changes["title"] = new_title
     if new_content:
-        note["content"] = new_content
+        note.content = changes["content"] = new_content
     if new_status:
-        if new_status in ["к выполнению", "в процессе", "ожидает", "выполнено", "отменено"]:
-            note["status"] = new_status
+        status = Status.from_label(new_status)
+        if status is not None:
+            note.status = status
+            changes["status"] = new_status
         else:
             print("Ошибка: Недопустимый статус. Допустимые значения: к выполнению, в процессе, ожидает, выполнено, отменено.")
+            item_edited(note, changes, before)
             return
     if new_priority:
-        if new_priority in ["высокий", "средний", "низкий"]:
-            note["priority"] = new_priority
+        priority = Priority.from_label(new_priority)
+        if priority is not None:
+            note.priority = priority
+            changes["priority"] = new_priority
         else:
             print("Ошибка: Недопустимый приоритет. Допустимые значения: высокий, средний, низкий.")
+            item_edited(note, changes, before)
             return
+    item_edited(note, changes, before)
     print("Заметка отредактирована.")
 
 
 def edit_task(task, new_title=None, new_description=None, new_status=None, new_priority=None):
     """Редактирует заголовок, описание, статус и/или приоритет задачи."""
+    before = {"title": task.title, "description": task.description, "status": task.status.label,
+              "priority": task.priority.label}
+    changes = {}  # Примененные изменения (для журнала)
     if new_title:
-        task["title"] = new_title
+        task.title = changes["title"] = new_title
     if new_description:
-        task["description"] = new_description
+        task.description = changes["description"] = new_description
     if new_status:
-        if new_status in ["к выполнению", "в процессе", "ожидает", "выполнено", "отменено"]:
-            task["status"] = new_status
+        status = Status.from_label(new_status)
+        if status is not None:
+            task.status = status
+            changes["status"] = new_status
         else:
             print("Ошибка: Недопустимый статус. Допустимые значения: к выполнению, в процессе, ожидает, выполнено, отменено.")
+            item_edited(task, changes, before)
             return
     if new_priority:
-        if new_priority in ["высокий", "средний", "низкий"]:
-            task["priority"] = new_priority
+        priority = Priority.from_label(new_priority)
+        if priority is not None:
+            task.priority = priority
+            changes["priority"] = new_priority
         else:
             print("Ошибка: Недопустимый приоритет. Допустимые значения: высокий, средний, низкий.")
+            item_edited(task, changes, before)
             return
+    item_edited(task, changes, before)
     print("Задача отредактирована.")
 
 
@@ -213,41 +852,96 @@ def delete_item(data, index, parent=None):
         print("Ошибка: Элемент с таким индексом не найден.")
         return
 
-    try:
-        index = int(index) - 1
-        if index < 0:
-            print("Ошибка: Некорректный индекс.")
-            return
+    if not remove_item(data, item):
+        print("Ошибка: Элемент с таким индексом не найден.")
+        return
 
-        if parent is None:
-            if item_type == "note":
-                if index < len(data["notes"]):
-                    deleted_title = data["notes"][index]["title"]
-                    del data["notes"][index]
-                    print(f"Заметка '{deleted_title}' удалена.")
-                else:
-                    print("Ошибка: Заметка с таким индексом не найдена.")
+    if parent is not None:
+        print(f"Элемент '{item.title}' удален.")
+    elif item_type == "note":
+        print(f"Заметка '{item.title}' удалена.")
+    else:
+        print(f"Задача '{item.title}' удалена.")
 
-            elif item_type == "task":
-                if index < len(data["tasks"]):
-                    deleted_title = data["tasks"][index]["title"]
-                    del data["tasks"][index]
-                    print(f"Задача '{deleted_title}' удалена.")
-                else:
-                    print("Ошибка: Задача с таким индексом не найдена.")
 
-            else:
-                print("Ошибка: Неверный тип элемента для удаления.")
+def remove_item(data, item):
+    """Убирает элемент (вместе с вложенными) из дерева и индексов. Возвращает False, если его там нет."""
+    container = get_container(data, item)
+    for position, other in enumerate(container):
+        if other is item:
+            del container[position]
+            item_removed(item, position)
+            return True
+    return False
+
+
+def insert_item(data, item, parent, position=None):
+    """Вставляет элемент (вместе с вложенными) на место position уровня parent (None - в конец)."""
+    if parent is None:
+        container = data["notes" if item.type == "note" else "tasks"]
+    else:
+        load_children(parent)
+        container = parent.children
+    if position is None or position >= len(container):
+        container.append(item)
+        position = None
+    else:
+        container.insert(position, item)
+    item_added(item, parent, position)
+
+
+def set_fields(item, fields):
+    """Записывает в элемент значения полей в формате файла (без проверок, для отмены и повтора)."""
+    before = {}
+    for field, value in fields.items():
+        if field == "status":
+            before[field] = item.status.label
+            item.status = Status.from_label(value)
+        elif field == "priority":
+            before[field] = item.priority.label
+            item.priority = Priority.from_label(value)
         else:
-            if index < len(parent["children"]):
-                deleted_title = parent["children"][index]["title"]
-                del parent["children"][index]
-                print(f"Элемент '{deleted_title}' удален.")
+            before[field] = getattr(item, field)
+            setattr(item, field, value)
+    item_edited(item, fields, before)
+
+
+def apply_step(data, operations, undo):
+    """Выполняет операции шага в обратную сторону (undo) или заново."""
+    history.paused = True
+    try:
+        for operation in reversed(operations) if undo else operations:
+            kind, item = operation[0], operation[1]
+            if kind == "edit":
+                set_fields(item, operation[2] if undo else operation[3])
+            elif (kind == "add") != undo:
+                insert_item(data, item, operation[2], operation[3] if kind == "remove" else None)
             else:
-                print("Ошибка: Элемент с таким индексом не найден.")
+                remove_item(data, item)
+    finally:
+        history.paused = False
+
+
+def undo(data):
+    """Отменяет последнюю изменившую данные команду."""
+    step = history.take_undo()
+    if step is None:
+        print("Нечего отменять.")
+        return False
+    apply_step(data, step[1], undo=True)
+    print(f"Отменено: {step[0]}")
+    return True
+
 
-    except ValueError:
-        print("Ошибка: Введите числовой индекс.")
+def redo(data):
+    """Повторяет последнюю отмененную команду."""
+    step = history.take_redo()
+    if step is None:
+        print("Нечего повторять.")
+        return False
+    apply_step(data, step[1], undo=False)
+    print(f"Повторено: {step[0]}")
+    return True
 
 
 def view_item(data, index, parent=None):
@@ -258,19 +952,20 @@ def view_item(data, index, parent=None):
         return None
 
     if item_type == "note":
+        load_children(item)
         display_note_content(item)
-        status_str, color = get_status_display(item["status"])  # Get display string and color
-        priority_str, priority_color = get_priority_display(item["priority"])
+        status_str, color = get_status_display(item.status)  # Get display string and color
+        priority_str, priority_color = get_priority_display(item.priority)
         print(f"Статус: {color}{status_str}{COLOR_RESET}")
         print(f"Приоритет: {priority_color}{priority_color}{COLOR_RESET}\n")
         return item
 
     elif item_type == "task":
-        status_str, color = get_status_display(item["status"])  # Get display string and color
-        priority_str, priority_color = get_priority_display(item["priority"])
+        status_str, color = get_status_display(item.status)  # Get display string and color
+        priority_str, priority_color = get_priority_display(item.priority)
 
-        print(f"\nЗадача: {item['title']}")
-        print(f"Описание: {item['description']}")
+        print(f"\nЗадача: {item.title}")
+        print(f"Описание: {item.description}")
         print(f"Статус: {color}{status_str}{COLOR_RESET}")
         print(f"Приоритет: {priority_color}{priority_color}{COLOR_RESET}\n")
         return None
@@ -280,181 +975,462 @@ def view_item(data, index, parent=None):
         return None
 
 
-def edit_item(data, index, parent=None):
-    """Редактирует заметку или задачу."""
+def edit_item(data, index, parent=None, fields=None):
+    """Редактирует заметку или задачу.
+
+    Если передан словарь fields (поле -> новое значение), новые значения берутся из него,
+    а не запрашиваются у пользователя.
+    """
     item, item_type = get_item_by_index(data, index, parent)
     if item is None:
         print("Ошибка: Элемент с таким индексом не найден.")
         return
 
-    if item_type == "note":
-        new_title = input("Новый заголовок (оставьте пустым, чтобы пропустить): ")
-        new_content = input("Новое содержимое (оставьте пустым, чтобы пропустить): ")
-        new_status = input(
-            f"Новый статус (к выполнению, в процессе, ожидает, выполнено, отменено, оставьте пустым, чтобы пропустить) [{item['status']}]: ")
-        new_priority = input(
-            f"Новый приоритет (высокий, средний, низкий, оставьте пустым, чтобы пропустить) [{item['priority']}]: ")
-        edit_note(item, new_title, new_content, new_status, new_priority)
+    text_field = "content" if item_type == "note" else "description"
+    if fields is None:
+        fields = ask_edit_fields(item_type, item.status.label, item.priority.label)
+    else:
+        unknown = set(fields) - {"title", text_field, "status", "priority"}
+        if unknown:
+            print(f"Ошибка: Неизвестные поля: {', '.join(sorted(unknown))}. "
+                  f"Допустимые поля: title, {text_field}, status, priority.")
+            return
+    edit = edit_note if item_type == "note" else edit_task
+    edit(item, fields.get("title"), fields.get(text_field), fields.get("status"), fields.get("priority"))
 
-    elif item_type == "task":
-        new_title = input("Новый заголовок (оставьте пустым, чтобы пропустить): ")
-        new_description = input("Новое описание (оставьте пустым, чтобы пропустить): ")
-        new_status = input(
-            f"Новый статус (к выполнению, в процессе, ожидает, выполнено, отменено, оставьте пустым, чтобы пропустить) [{item['status']}]: ")
-        new_priority = input(
-            f"Новый приоритет (высокий, средний, низкий, оставьте пустым, чтобы пропустить) [{item['priority']}]: ")
-        edit_task(item, new_title, new_description, new_status, new_priority)
 
+def ask_edit_fields(item_type, status, priority):
+    """Спрашивает у пользователя новые значения полей. Возвращает словарь поле -> значение."""
+    fields = {"title": input("Новый заголовок (оставьте пустым, чтобы пропустить): ")}
+    if item_type == "note":
+        fields["content"] = input("Новое содержимое (оставьте пустым, чтобы пропустить): ")
     else:
-        print("Ошибка: Неверный тип элемента.")
+        fields["description"] = input("Новое описание (оставьте пустым, чтобы пропустить): ")
+    fields["status"] = input(
+        f"Новый статус (к выполнению, в процессе, ожидает, выполнено, отменено, оставьте пустым, чтобы пропустить) [{status}]: ")
+    fields["priority"] = input(
+        f"Новый приоритет (высокий, средний, низкий, оставьте пустым, чтобы пропустить) [{priority}]: ")
+    return fields
 
 
 def get_item_by_index(data, index, parent=None):
     """Получает элемент (задачу или заметку) по индексу, автоматически определяя тип."""
-    try:
-        index = int(index) - 1
-        if index < 0:
-            print("Ошибка: Некорректный индекс.")
+    with phase("lookup"):
+        try:
+            index = int(index) - 1
+            if index < 0:
+                print("Ошибка: Некорректный индекс.")
+                return None, None
+
+            if parent is None:
+                if index < len(data["notes"]):
+                    return data["notes"][index], "note"
+                index -= len(data["notes"])  # Сдвигаем индекс, чтобы искать в задачах
+
+                if index < len(data["tasks"]):
+                    return data["tasks"][index], "task"
+                else:
+                    print("Ошибка: Элемент с таким индексом не найден.")
+                    return None, None
+            else:
+                if index < len(parent.children):
+                    item = parent.children[index]
+                    return item, item.type
+                else:
+                    print("Ошибка: Элемент с таким индексом не найден.")
+                    return None, None
+
+        except ValueError:
+            print("Ошибка: Введите числовой индекс.")
             return None, None
 
-        if parent is None:
-            if index < len(data["notes"]):
-                return data["notes"][index], "note"
-            index -= len(data["notes"])  # Сдвигаем индекс, чтобы искать в задачах
 
-            if index < len(data["tasks"]):
-                return data["tasks"][index], "task"
+class Session:
+    """Состояние работы с данными: текущая заметка, путь к ней и страница списка."""
+
+    def __init__(self, data):
+        self.data = data
+        self.context = None  # Отслеживание текущего контекста (в какой заметке мы находимся)
+        self.breadcrumbs = []  # Путь от корня до текущей заметки
+        self.page = 0  # Номер страницы списка текущего уровня
+        self.batch = False  # Пакетный режим: изменения сохраняются один раз в конце
+        self.interactive = True  # Можно ли задавать вопросы через input()
+
+    def restore_context(self):
+        """Поднимается выше заметок, которых больше нет в дереве. Возвращает первую из них (или None)."""
+        for depth, note in enumerate(self.breadcrumbs):
+            if items_by_id.get(note.id) is not note:
+                del self.breadcrumbs[depth:]
+                self.context = self.breadcrumbs[-1] if self.breadcrumbs else None
+                self.page = 0
+                return note
+        return None
+
+    def page_count(self):
+        """Возвращает количество страниц на текущем уровне."""
+        if self.context is None:
+            return max(page_count(self.data["notes"]), page_count(self.data["tasks"]))
+        return page_count(self.context.children)
+
+
+def display_screen(session):
+    """Выводит текущий уровень и список команд."""
+    pages = session.page_count()
+    session.page = min(session.page, pages - 1)
+    print("\n--- Заметки ---")
+    if session.context is None:
+        print("Корневой уровень")
+        print("Заметки:")
+        display_items(session.data["notes"], page=session.page)
+        print("\nЗадачи:")
+        display_items(session.data["tasks"], page=session.page)
+    else:
+        print(f"Вы находитесь в заметке: {' / '.join(note.title for note in session.breadcrumbs)}")
+        display_items(session.context.children, page=session.page)
+    if pages > 1:
+        print(f"\nСтраница {session.page + 1} из {pages}")
+
+    print("\nКоманды:")
+    print("+n|t <название> - Добавить заметку|задачу")
+    print("e|d|v <индекс> - Редактировать|Удалить|Просмотреть элемент (задачу или заметку)")
+    print("e <индекс> поле=значение ... - Редактировать без вопросов (поля title, content|description, status, priority)")
+    print(".. [n] - Вернуться на уровень (или на n уровней) выше")
+    print("> | < - Следующая | предыдущая страница")
+    print("s <запрос> - Поиск по заголовкам, содержимому и описаниям")
+    print("f <поле=значение> ... [here] - Фильтр по type, status, priority (пробел в значении - '_')")
+    print("export <файл> [индекс] - Выгрузить текущий уровень (или элемент) в NDJSON")
+    print("import <файл> - Загрузить элементы из NDJSON в текущий уровень")
+    print("archive <файл> - Перенести выполненные и отмененные элементы в NDJSON-архив")
+    print("u | r - Отменить | повторить последнее изменение")
+    if profiler is not None:
+        print("stats - Время по фазам работы (вызовы и процентили)")
+    print("q - Выход")
+
+
+def parse_fields(args):
+    """Разбирает аргументы вида поле=значение (значения с пробелами берутся в кавычки)."""
+    fields = {}
+    for arg in shlex.split(args):
+        field, sep, value = arg.partition("=")
+        if not sep:
+            print(f"Ошибка: Ожидалось поле=значение, получено '{arg}'.")
+            return None
+        fields[field] = value
+    return fields
+
+
+def execute_command(session, line):
+    """Выполняет одну команду. Возвращает False, если пора выходить."""
+    with phase("parse"):
+        command = line.split()
+
+    if not command:
+        return True
+
+    action = command[0]
+    data = session.data
+    mutated = False
+
+    if action == "+n":
+        if len(command) > 1:
+            title = " ".join(command[1:])
+            with phase("mutation"):
+                add_note(data, title, parent=session.context)
+            mutated = True
+        else:
+            print("Ошибка: Укажите название заметки.")
+
+    elif action == "+t":
+        if len(command) > 2:
+            title = command[1]
+            description = " ".join(command[2:])
+            with phase("mutation"):
+                add_task(data, title, description, parent=session.context)
+            mutated = True
+        else:
+            print("Ошибка: Укажите название и описание задачи.")
+
+    elif action == "e":
+        if len(command) > 2:
+            try:
+                with phase("parse"):
+                    fields = parse_fields(line.split(None, 2)[2])
+            except ValueError as e:
+                print(f"Ошибка: {e}.")
+                fields = None
+            if fields is not None:
+                with phase("mutation"):
+                    edit_item(data, command[1], parent=session.context, fields=fields)
+                mutated = True
+        elif len(command) > 1:
+            if not session.interactive:
+                print("Ошибка: Укажите новые значения: e <индекс> поле=значение ...")
             else:
-                print("Ошибка: Элемент с таким индексом не найден.")
-                return None, None
+                # Без замера: время ответов на вопросы к работе программы не относится
+                index = command[1]
+                edit_item(data, index, parent=session.context)
+                mutated = True
+        else:
+            print("Ошибка: Укажите индекс элемента для редактирования.")
+
+    elif action == "d":
+        if len(command) > 1:
+            index = command[1]
+            with phase("mutation"):
+                delete_item(data, index, parent=session.context)
+            mutated = True
+        else:
+            print("Ошибка: Укажите индекс элемента для удаления.")
+
+    elif action == "v":
+        if len(command) > 1:
+            index = command[1]
+            new_context = view_item(data, index, parent=session.context)
+            if new_context and new_context.type == "note":
+                session.context = new_context
+                session.breadcrumbs.append(new_context)
+                session.page = 0
         else:
-            if index < len(parent["children"]):
-                item = parent["children"][index]
-                return item, item["type"]
+            print("Ошибка: Укажите индекс элемента для просмотра.")
+
+    elif action == "..":
+        if session.context is not None:
+            levels = command[1] if len(command) > 1 else "1"
+            if levels.isdigit() and int(levels) > 0:
+                with phase("parent"):
+                    del session.breadcrumbs[-int(levels):]
+                    session.context = session.breadcrumbs[-1] if session.breadcrumbs else None
+                    session.page = 0
             else:
-                print("Ошибка: Элемент с таким индексом не найден.")
-                return None, None
+                print("Ошибка: Укажите число уровней.")
+        else:
+            print("Вы уже находитесь на корневом уровне.")
 
-    except ValueError:
-        print("Ошибка: Введите числовой индекс.")
-        return None, None
+    elif action == ">":
+        if session.page < session.page_count() - 1:
+            session.page += 1
+        else:
+            print("Это последняя страница.")
 
+    elif action == "<":
+        if session.page > 0:
+            session.page -= 1
+        else:
+            print("Это первая страница.")
 
-def main():
-    """Основная функция программы."""
-    data = load_data()
-    current_context = None  # Отслеживание текущего контекста (в какой заметке мы находимся)
-
-    while True:
-        print("\n--- Заметки ---")
-        if current_context is None:
-            print("Корневой уровень")
-            print("Заметки:")
-            display_items(data["notes"])
-            print("\nЗадачи:")
-            display_items(data["tasks"])
+    elif action == "s":
+        if len(command) > 1:
+            search_items(" ".join(command[1:]))
         else:
-            print(f"Вы находитесь в заметке: {current_context['title']}")
-            display_items(current_context["children"])
+            print("Ошибка: Укажите, что искать.")
 
-        print("\nКоманды:")
-        print("+n|t <название> - Добавить заметку|задачу")
-        print("e|d|v <индекс> - Редактировать|Удалить|Просмотреть элемент (задачу или заметку)")
-        print(".. - Вернуться на уровень выше")
-        print("q - Выход")
+    elif action == "f":
+        if len(command) > 1:
+            filter_items(command[1:], context=session.context)
+        else:
+            print("Ошибка: Укажите условия фильтра.")
 
-        command = input("Введите команду: ").split()
+    elif action == "export":
+        if len(command) == 2:
+            if session.context is None:
+                items = data["notes"] + data["tasks"]
+            else:
+                items = session.context.children
+            export_items(items, command[1], parent=session.context)
+        elif len(command) == 3:
+            item, _ = get_item_by_index(data, command[2], session.context)
+            if item is not None:
+                export_items([item], command[1], parent=session.context)
+        else:
+            print("Ошибка: Укажите файл (и, если нужно, индекс элемента).")
 
-        if not command:
-            continue
+    elif action == "import":
+        if len(command) == 2:
+            try:
+                with phase("mutation"):
+                    import_items(data, command[1], parent=session.context)
+                mutated = True
+            except OSError as e:
+                print(f"Ошибка: Не удалось прочитать файл: {e}")
+        else:
+            print("Ошибка: Укажите файл для загрузки.")
+
+    elif action == "archive":
+        if len(command) == 2:
+            with phase("mutation"):
+                archive_items(data, command[1])
+            mutated = True
+            # В архив могла уйти текущая заметка или одна из тех, в которые она вложена
+            removed = session.restore_context()
+            if removed is not None:
+                print(f"Заметка '{removed.title}' перенесена в архив, переход на уровень выше.")
+        else:
+            print("Ошибка: Укажите файл архива.")
 
-        action = command[0]
+    elif action == "u":
+        with phase("mutation"):
+            mutated = undo(data)
+        session.restore_context()
 
-        if action == "+n":
-            if len(command) > 1:
-                title = " ".join(command[1:])
-                add_note(data, title, parent=current_context)
-                save_data(data)
-            else:
-                print("Ошибка: Укажите название заметки.")
-
-        elif action == "+t":
-            if len(command) > 2:
-                title = command[1]
-                description = " ".join(command[2:])
-                add_task(data, title, description, parent=current_context)
-                save_data(data)
-            else:
-                print("Ошибка: Укажите название и описание задачи.")
+    elif action == "r":
+        with phase("mutation"):
+            mutated = redo(data)
+        session.restore_context()
 
-        elif action == "e":
-            if len(command) > 1:
-                index = command[1]
-                edit_item(data, index, parent=current_context)
-                save_data(data)
-            else:
-                print("Ошибка: Укажите индекс элемента для редактирования.")
+    elif action == "stats":
+        print_stats()
 
-        elif action == "d":
-            if len(command) > 1:
-                index = command[1]
-                delete_item(data, index, parent=current_context)
-                save_data(data)
-            else:
-                print("Ошибка: Укажите индекс элемента для удаления.")
+    elif action == "q":
+        return False
 
-        elif action == "v":
-            if len(command) > 1:
-                index = command[1]
-                new_context = view_item(data, index, parent=current_context)
-                if new_context and new_context["type"] == "note":
-                    current_context = new_context
-            else:
-                print("Ошибка: Укажите индекс элемента для просмотра.")
-
-        elif action == "..":
-            if current_context is not None:
-                # Возвращаемся на уровень вверх. Если мы в корне, ничего не делаем.
-                # Нужно хранить историю, чтобы возвращаться не только на один уровень.
-                # Но для простоты пока так.
-                def find_parent(data, node):
-                    """Находит родительскую заметку для заданного узла."""
-                    # Проверяем корневые заметки
-                    for note in data["notes"]:
-                        if note is node:
-                            return None  # Это корневая заметка, родителя нет
-
-                    # Рекурсивный поиск в дочерних элементах
-                    def search_children(parent, node):
-                        if "children" in parent:
-                            for child in parent["children"]:
-                                if child is node:
-                                    return parent
-                                else:
-                                    found = search_children(child, node)
-                                    if found:
-                                        return found
-                        return None
-
-                    for note in data["notes"]:
-                        found = search_children(note, node)
-                        if found:
-                            return found
-
-                    return None  # Родитель не найден
-
-                parent = find_parent(data, current_context)
-                current_context = parent  # переходим к родителю.
-            else:
-                print("Вы уже находитесь на корневом уровне.")
+    else:
+        print("Неизвестная команда.")
+
+    if mutated:
+        if action not in ("u", "r") and not history.end_step(line):
+            print("Предупреждение: Изменение слишком большое, чтобы его можно было отменить. История отмены очищена.")
+        if not session.batch:
+            with phase("commit"):
+                commit_changes(data)
+    return True
+
+
+def run_batch(data, lines, quiet=False):
+    """Выполняет команды из файла или stdin и сохраняет данные один раз в конце."""
+    session = Session(data)
+    session.batch = True
+    session.interactive = False
+    if _storage is not None:
+        _storage.begin_batch()
+
+    count = 0
+    started = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            if quiet:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                count += 1
+                if not execute_command(session, line):
+                    break
+        executed = time.perf_counter() - started
+    finally:
+        # Прерванный пакет сохраняет уже выполненные команды
+        if _storage is not None:
+            _storage.end_batch(DataSnapshot(data))
+    total = time.perf_counter() - started
+
+    rate = count / executed if executed > 0 else float("inf")
+    print(f"Выполнено команд: {count} за {executed:.3f} с ({rate:.0f} команд/с), "
+          f"сохранение: {total - executed:.3f} с.")
+
+
+def main():
+    """Основная функция программы."""
+    parser = argparse.ArgumentParser(description="Заметки и задачи.")
+    parser.add_argument("--storage", choices=["json", "sqlite", "sharded"], default=STORAGE_BACKEND,
+                        help="тип хранилища (по умолчанию %(default)s)")
+    parser.add_argument("--codec", choices=CODECS, default=SNAPSHOT_CODEC,
+                        help=f"формат, в котором записывается {DATA_FILE} (по умолчанию %(default)s)")
+    parser.add_argument("--migrate", action="store_true",
+                        help=f"перенести данные из {DATA_FILE} в {DB_FILE} (с --storage sharded - в {SHARDS_DIR}) и выйти")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="выполнить команды из файла ('-' - из stdin) и сохранить данные один раз")
+    parser.add_argument("--quiet", action="store_true", help="в пакетном режиме не выводить сообщения команд")
+    parser.add_argument("--export", metavar="FILE", help="выгрузить все данные в NDJSON-файл и выйти")
+    parser.add_argument("--import", dest="import_file", metavar="FILE",
+                        help="загрузить элементы из NDJSON-файла в корневой уровень и выйти")
+    parser.add_argument("--recover", nargs="?", const=DATA_FILE, metavar="FILE",
+                        help=f"спасти элементы из поврежденного снимка (по умолчанию {DATA_FILE}) в отдельный "
+                             "NDJSON-файл и выйти; сам файл не меняется")
+    parser.add_argument("--profile", action="store_true",
+                        help="замерять время по фазам работы (отчет - команда stats)")
+    parser.add_argument("--cprofile", metavar="FILE", help="записать профиль cProfile сессии в файл (включает --profile)")
+    parser.add_argument("--serve", action="store_true",
+                        help=f"держать данные в памяти и принимать команды через сокет {SOCKET_FILE}")
+    args = parser.parse_args()
+
+    if args.profile or args.cprofile:
+        enable_profiling(args.cprofile)
+
+    if args.recover:
+        if not os.path.exists(args.recover):
+            print(f"Ошибка: Файл {args.recover} не найден.")
+            sys.exit(1)
+        output = unused_path(recovered_path(DATA_FILE))
+        salvage_file(args.recover, output)
+        print(f"Загрузить их в данные: note.py --import {output}")
+        return
 
-        elif action == "q":
-            print("Выход.")
-            break
+    import server  # Модуль сервера сам импортирует note.py
 
+    if args.serve:
+        server.serve(args.storage, SOCKET_FILE, args.codec)
+        return
+
+    connection = server.connect(SOCKET_FILE)
+    if connection is not None:
+        if args.migrate or args.batch or args.export or args.import_file:
+            connection.close()
+            print(f"Ошибка: Данные открыты сервером ({SOCKET_FILE}). Остановите его, чтобы работать с файлами напрямую.")
+            sys.exit(1)
+        server.run_client(connection)
+        return
+
+    if args.migrate:
+        target = SHARDS_DIR if args.storage == "sharded" else DB_FILE
+        if args.storage == "sharded":
+            count = migrate_json_to_shards(DATA_FILE, JOURNAL_FILE, SHARDS_DIR)
         else:
-            print("Неизвестная команда.")
+            count = migrate_json_to_sqlite(DATA_FILE, JOURNAL_FILE, DB_FILE)
+        print(f"Перенесено элементов: {count} ({DATA_FILE} -> {target}).")
+        return
+
+    open_storage(args.storage, args.codec)
+    # Отложенный снимок и файлы индексов записываются и при выходе по Ctrl+C или концу ввода
+    try:
+        data = load_data()
+
+        if args.export:
+            export_items(data["notes"] + data["tasks"], args.export)
+            return
+
+        if args.import_file:
+            _storage.begin_batch()
+            import_items(data, args.import_file)
+            _storage.end_batch(DataSnapshot(data))
+            return
+
+        if args.batch:
+            if args.batch == "-":
+                run_batch(data, sys.stdin, quiet=args.quiet)
+            else:
+                with open(args.batch, "r", encoding="utf-8") as f:
+                    run_batch(data, f, quiet=args.quiet)
+            return
+
+        session = Session(data)
+        while True:
+            display_screen(session)
+            try:
+                line = input("Введите команду: ")
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            with storage_lock():
+                running = execute_command(session, line)
+            if not running:
+                break
+    finally:
+        close_storage()
+    print("Выход.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # server.py импортирует note: он должен получить этот же модуль, а не вторую копию
+    sys.modules.setdefault("note", sys.modules[__name__])
+    main()
@@ -0,0 +1,58 @@
+"""Замеры времени по фазам работы note.py (включаются флагом --profile).
+
+Фаза - участок цикла команд (разбор ввода, поиск элемента по индексу, изменение,
+сохранение, отрисовка, переход на уровень выше). Для каждой фазы запоминается длительность
+каждого вызова, а отчет показывает количество вызовов и процентили.
+"""
+import collections
+import contextlib
+import math
+import time
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, percent):
+    """Возвращает процентиль отсортированного списка (по ближайшему рангу)."""
+    return samples[max(0, math.ceil(len(samples) * percent / 100) - 1)]
+
+
+class Profiler:
+    """Длительности вызовов по фазам и дополнительные величины (например, записанные байты)."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)  # фаза -> длительности вызовов в секундах
+        self.totals = collections.defaultdict(collections.Counter)  # фаза -> сумма доп. величин
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Замеряет время выполнения блока with как один вызов фазы."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+    def record(self, name, seconds, **values):
+        """Добавляет уже замеренный вызов фазы (например, из фонового потока записи)."""
+        self.samples[name].append(seconds)
+        self.totals[name].update(values)
+
+    def record_save(self, stats):
+        """Принимает сведения о записи снимка от хранилища."""
+        self.record("save", stats["serialize"] + stats["write"] + stats["fsync"], **stats)
+
+    def report(self):
+        """Возвращает строки отчета: вызовы, суммарное время и процентили по каждой фазе."""
+        header = "".join(f"{f'p{percent}, мс':>12}" for percent in PERCENTILES)
+        lines = [f"{'Фаза':<10}{'Вызовов':>9}{'Всего, мс':>12}{header}{'Макс., мс':>12}"]
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            row = "".join(f"{percentile(ordered, percent) * 1000:12.3f}" for percent in PERCENTILES)
+            lines.append(f"{name:<10}{len(ordered):9}{sum(ordered) * 1000:12.3f}{row}{ordered[-1] * 1000:12.3f}")
+            totals = self.totals.get(name)
+            if totals:
+                lines.append("  " + ", ".join(
+                    f"{key}: {value}" if key == "bytes" else f"{key}: {value * 1000:.3f} мс"
+                    for key, value in sorted(totals.items())))
+        return lines
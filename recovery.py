@@ -0,0 +1,454 @@
+"""Спасение данных из поврежденного файла снимка.
+
+Файл читается кусками по CHUNK_SIZE байт и разбирается терпимым к ошибкам разборщиком:
+лексемы JSON (строки, числа, скобки) выделяются регулярным выражением, а непонятные байты
+пропускаются. Разборщик держит только стек открытых объектов и массивов, а корневой
+элемент (заметка со всем содержимым или задача) выдается, как только он закрылся, и
+больше в памяти не хранится. Поэтому память ограничена размером куска и самого большого
+корневого элемента, а файл любого размера читается за один проход.
+
+Объект считается элементом, если у него есть "type" (note или task) или "title".
+Недостающие поля элемента заполняются значениями по умолчанию, а сам элемент
+засчитывается как поврежденный. Двоичный снимок (snapshots.py) читается по записям, и
+разборщиком разбираются только записи, которые не удалось прочитать целиком.
+"""
+import json
+import re
+import uuid
+
+from snapshots import FOOTER, LENGTH, MAGIC
+
+CHUNK_SIZE = 1024 * 1024
+MAX_STRING = 64 * 1024 * 1024  # Строка длиннее считается оборванной кавычкой, а не текстом
+MAX_REPORTED = 20  # Сколько мест повреждений перечислять в отчете
+INDENT = 4  # Отступ формата pretty (snapshots.encode)
+
+# Двоеточия и запятые разборщику не нужны (ключ от значения отличается порядком), поэтому
+# они пропускаются вместе с пробелами. Строка не может содержать перевод строки и должна
+# кончаться перед :,}] - иначе кавычка лишняя или потерянная, и строки с разметкой
+# поменялись местами; такая "строка" считается мусором, что возвращает разбор в колею.
+TOKEN_RE = re.compile(
+    rb'([ \t\r\n:,]*)(?:("(?:[^"\\\n]|\\.)*"(?=[ \t\r\n]*(?:[:,}\]]|$)))|([{}\[\]])'
+    rb'|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null))')
+RESYNC_RE = re.compile(rb'[{}\[\]"]')  # Где может начинаться что-то осмысленное после мусора
+OPEN_STRING_RE = re.compile(rb'"(?:[^"\\\n]|\\.)*\\?')  # Строка, не закрытая до конца буфера
+LITERALS = {b"true": True, b"false": False, b"null": None}
+ITEM_TYPES = ("note", "task")
+
+
+class Report:
+    """Что удалось спасти и что потеряно."""
+
+    def __init__(self):
+        self.notes = 0
+        self.tasks = 0
+        self.partial = 0  # Элементы, у которых пришлось додумать поля
+        self.dropped = 0  # Объекты, похожие на элементы, но без заголовка и типа
+        self.skipped_bytes = 0  # Байты, которые не удалось разобрать
+        self.damage = []  # Смещения мест повреждений (первые MAX_REPORTED)
+        self.damage_count = 0
+        self.truncated = False  # Файл оборвался внутри незакрытых объектов
+
+    def damaged(self, offset):
+        self.damage_count += 1
+        if len(self.damage) < MAX_REPORTED:
+            self.damage.append(offset)
+
+    def lines(self):
+        """Возвращает строки отчета."""
+        lines = [f"Спасено элементов: {self.notes + self.tasks} (заметок: {self.notes}, задач: {self.tasks})."]
+        if self.partial:
+            lines.append(f"Элементов с недостающими полями (заполнены значениями по умолчанию): {self.partial}.")
+        if self.dropped:
+            lines.append(f"Потеряно объектов без заголовка и типа: {self.dropped}.")
+        if self.damage_count:
+            places = ", ".join(str(offset) for offset in self.damage)
+            more = f" и еще {self.damage_count - len(self.damage)}" if self.damage_count > len(self.damage) else ""
+            lines.append(f"Повреждений: {self.damage_count}, пропущено байт: {self.skipped_bytes} "
+                         f"(смещения: {places}{more}).")
+        if self.truncated:
+            lines.append("Файл оборван: последние элементы могли потерять часть содержимого.")
+        return lines
+
+
+class _Frame:
+    """Открытый объект или массив."""
+
+    __slots__ = ("is_object", "role", "fields", "key", "items", "damaged")
+
+    def __init__(self, is_object, role):
+        self.is_object = is_object
+        self.role = role  # Ключ, под которым лежит в родительском объекте (None - в массиве)
+        self.fields = {}  # Скалярные поля объекта и его массивы
+        self.key = None  # Прочитанный ключ, значение которого еще не пришло
+        self.items = []  # Элементы, собранные в массиве
+        self.damaged = False
+
+    def is_item(self):
+        return self.is_object and ("type" in self.fields or "title" in self.fields)
+
+
+class Salvage:
+    """Разбор поврежденного файла. records() выдает спасенные элементы, report - отчет."""
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.report = Report()
+        self._stack = []
+        self._ready = []  # Закрытые корневые элементы, еще не выданные records()
+
+    def records(self):
+        """Выдает спасенные элементы плоскими записями (как при выгрузке в NDJSON).
+
+        У каждой записи есть поля элемента, id родителя ("parent") и глубина ("depth");
+        родитель всегда идет раньше своих вложенных элементов.
+        """
+        with open(self.path, "rb") as f:
+            head = f.read(len(MAGIC))
+            chunks = self._binary_chunks(f) if head == MAGIC else self._chunks(f, 0)
+            for _ in self._scan(chunks):
+                for item in self._ready:
+                    yield from self._flatten(item)
+                self._ready.clear()
+
+    def _chunks(self, f, offset, stop=None):
+        """Выдает (смещение, кусок) до stop (или до конца файла)."""
+        f.seek(offset)
+        while stop is None or offset < stop:
+            size = self.chunk_size if stop is None else min(self.chunk_size, stop - offset)
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield offset, chunk
+            offset += len(chunk)
+
+    def _binary_chunks(self, f):
+        """Выдает участки двоичного снимка для разбора как текста.
+
+        Целые записи сразу становятся корневыми элементами. Запись с правильной длиной, но
+        испорченным содержимым разбирается как текст; если испорчена сама длина, текстом
+        разбирается все до следующего места, где начинается целая запись. Конец участка
+        отмечается куском None.
+        """
+        end = self._records_end(f)
+        offset = len(MAGIC)
+        while offset + LENGTH.size <= end:
+            f.seek(offset)
+            (length,) = LENGTH.unpack(f.read(LENGTH.size))
+            start = offset + LENGTH.size
+            if start + length <= end:
+                item = self._read_record(f, start, length)
+                if item is not None:
+                    self._ready.append(self._normalize(item))
+                    yield offset, b""
+                    offset = start + length
+                    continue
+                stop = start + length
+            else:
+                stop = self._resync(f, start, end)
+                start = offset
+            self.report.damaged(offset)
+            yield from self._chunks(f, start, stop)
+            yield stop, None
+            offset = stop
+
+    def _records_end(self, f):
+        """Смещение конца записей (начала оглавления), а если подвал испорчен - размер файла."""
+        size = f.seek(0, 2)
+        if size >= len(MAGIC) + FOOTER.size:
+            f.seek(size - FOOTER.size)
+            index_offset, _, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic == MAGIC and len(MAGIC) <= index_offset <= size - FOOTER.size:
+                return index_offset
+        return size
+
+    def _read_record(self, f, start, length):
+        """Читает запись и возвращает элемент или None, если она не разбирается."""
+        f.seek(start)
+        try:
+            item = json.loads(f.read(length))
+        except ValueError:
+            return None
+        if isinstance(item, dict) and (item.get("type") in ITEM_TYPES or "title" in item):
+            return item
+        return None
+
+    def _resync(self, f, offset, end):
+        """Ищет после offset начало целой записи (ее длину) или оглавление; иначе возвращает end."""
+        marker = b'{"id":'
+        position = offset
+        while position < end:
+            f.seek(position)
+            chunk = f.read(min(self.chunk_size + len(marker), end - position))
+            if chunk.startswith(b'[["'):
+                return position  # Оглавление при испорченном подвале
+            found = chunk.find(marker, 1)
+            while found != -1:
+                record = position + found
+                if record - LENGTH.size >= offset:
+                    f.seek(record - LENGTH.size)
+                    (length,) = LENGTH.unpack(f.read(LENGTH.size))
+                    if record + length <= end and self._read_record(f, record, length) is not None:
+                        return record - LENGTH.size
+                found = chunk.find(marker, found + 1)
+            position += self.chunk_size
+        return end
+
+    def _scan(self, chunks):
+        """Разбирает куски; после каждого куска управление возвращается в records().
+
+        Кусок None завершает участок: то, что в нем осталось незакрытым, закрывается.
+        """
+        buffer = b""
+        base = 0  # Смещение начала buffer в файле
+        for offset, chunk in chunks:
+            if chunk is None:
+                self._tokens(buffer, base, final=True)
+                self._close_all(offset)
+                buffer = b""
+                yield
+                continue
+            if not buffer:
+                base = offset
+            buffer += chunk
+            position = self._tokens(buffer, base, final=False)
+            buffer = buffer[position:]
+            base += position
+            yield
+        self._tokens(buffer, base, final=True)
+        if self._stack:
+            self.report.truncated = True
+            self._close_all(base + len(buffer))
+        yield
+
+    def _close_all(self, offset):
+        while self._stack:
+            self._close(self._stack[-1].is_object, offset)
+
+    def _tokens(self, buffer, base, final):
+        """Разбирает лексемы буфера. Возвращает позицию, с которой нужно продолжить."""
+        position = 0
+        size = len(buffer)
+        while position < size:
+            match = TOKEN_RE.match(buffer, position)
+            if match is not None:
+                if not final and match.end() == size:
+                    break  # Число или скобка в самом конце: возможно, продолжение в следующем куске
+                prefix, string, bracket, scalar = match.groups()
+                if string is not None:
+                    self._value(_string(string), is_string=True, offset=base + position)
+                elif bracket is not None:
+                    if bracket in b"{[":
+                        self._open(bracket == b"{", base + position, _depth(prefix))
+                    else:
+                        self._close(bracket == b"}", base + position, _depth(prefix))
+                elif scalar is not None:
+                    value = LITERALS[scalar] if scalar in LITERALS else _number(scalar)
+                    self._value(value, is_string=False, offset=base + position)
+                position = match.end()
+                continue
+            found = RESYNC_RE.search(buffer, position + 1)
+            rest = buffer[position:].lstrip(b" \t\r\n:,")
+            # Ждать следующего куска стоит, только если лексема дошла до конца буфера. Кавычка,
+            # у которой закрывающая кавычка или перевод строки уже есть, - мусор: иначе файл в
+            # одну строку (compact, orjson) копился бы в буфере до MAX_STRING
+            if not final and size - position < MAX_STRING and (
+                    found is None or OPEN_STRING_RE.fullmatch(buffer, size - len(rest)) is not None):
+                break  # Лексема (строка, литерал, число) может продолжиться в следующем куске
+            if not rest:
+                return size
+            # Мусор: пропускаем до следующей скобки или кавычки
+            end = found.start() if found is not None else size
+            self.report.damaged(base + position)
+            self.report.skipped_bytes += end - position
+            if self._stack:
+                self._stack[-1].damaged = True
+            position = end
+        return position
+
+    def _value(self, value, is_string, offset):
+        if not self._stack:
+            return  # Значение вне всякого объекта
+        top = self._stack[-1]
+        if not top.is_object:
+            return  # Скаляры в массивах (оглавление двоичного формата и т. п.) не нужны
+        if top.key is None:
+            if is_string:
+                top.key = value
+            else:
+                top.damaged = True
+                self.report.damaged(offset)
+        else:
+            top.fields[top.key] = value
+            top.key = None
+
+    def _open(self, is_object, offset, depth=None):
+        # С начала строки открываются только элементы массивов. Если по отступу уровень
+        # мельче, чем стек, - мусор открыл объекты, которые уже не закроются
+        if depth is not None and depth < len(self._stack) and (depth == 0 or not self._stack[depth - 1].is_object):
+            self._trim(depth, offset)
+        role = None
+        if self._stack and self._stack[-1].is_object:
+            top = self._stack[-1]
+            role, top.key = top.key, None
+            if role is None:
+                top.damaged = True
+                self.report.damaged(offset)
+        self._stack.append(_Frame(is_object, role))
+
+    def _close(self, is_object, offset, depth=None):
+        """Закрывает объект или массив; незакрытые внутри него считаются поврежденными.
+
+        depth - уровень скобки по отступу (если он известен): лишние уровни над ним
+        закрываются, даже если скобки у них того же вида.
+        """
+        if depth is not None and depth < len(self._stack) and self._stack[depth].is_object == is_object:
+            self._trim(depth + 1, offset)
+        if not any(frame.is_object == is_object for frame in self._stack):
+            self.report.damaged(offset)  # Лишняя закрывающая скобка
+            return
+        while True:
+            frame = self._stack.pop()
+            if frame.is_object == is_object:
+                self._finish(frame)
+                return
+            frame.damaged = True
+            self.report.damaged(offset)
+            self._finish(frame)
+
+    def _trim(self, depth, offset):
+        """Закрывает как поврежденные все уровни стека глубже depth."""
+        while len(self._stack) > depth:
+            frame = self._stack.pop()
+            frame.damaged = True
+            self.report.damaged(offset)
+            self._finish(frame)
+
+    def _finish(self, frame):
+        parent = self._stack[-1] if self._stack else None
+        if not frame.is_object:
+            if parent is not None and parent.is_object:
+                parent.fields.setdefault(frame.role or "children", []).extend(frame.items)
+            else:
+                self._place(frame.items, parent)
+            return
+        if frame.is_item():
+            self._place([self._item(frame)], parent)
+            return
+        # Не элемент: корень файла или объект, потерявший заголовок и тип
+        children = [item for item in frame.fields.get("children", ()) if isinstance(item, dict)]
+        if set(frame.fields) - {"notes", "tasks", "children"}:
+            self.report.dropped += 1
+        self._place(children, parent)
+
+    def _place(self, items, parent):
+        """Отдает закрытые элементы родительскому массиву или выдает их как корневые."""
+        if not items:
+            return
+        if any(frame.is_item() for frame in self._stack):
+            if parent is not None and not parent.is_object:
+                parent.items.extend(items)
+            elif parent is not None:
+                parent.fields.setdefault("children", []).extend(items)
+            return
+        self._ready.extend(items)
+
+    def _item(self, frame):
+        """Собирает элемент из полей объекта, заполняя недостающие."""
+        fields = frame.fields
+        partial = frame.damaged
+        children = [item for item in fields.get("children", ()) if isinstance(item, dict)]
+        item_type = fields.get("type")
+        if item_type not in ITEM_TYPES:
+            item_type = "note" if children or "content" in fields else "task"
+            partial = True
+        item = {"id": fields.get("id"), "type": item_type}
+        if not isinstance(item["id"], str):
+            item["id"] = uuid.uuid4().hex
+            partial = True
+        for field, default in (("title", "(без заголовка)"),
+                               ("content" if item_type == "note" else "description", ""),
+                               ("status", "к выполнению"), ("priority", "средний")):
+            value = fields.get(field)
+            if not isinstance(value, str):
+                value = default
+                partial = True
+            item[field] = value
+        if item_type == "note":
+            item["children"] = children
+        if partial:
+            self.report.partial += 1
+        return item
+
+    def _normalize(self, item):
+        """Проверяет элемент, целиком прочитанный из двоичной записи."""
+        frame = _Frame(True, None)
+        frame.fields = item
+        frame.fields["children"] = [self._normalize(child) for child in item.get("children", ())
+                                    if isinstance(child, dict)]
+        return self._item(frame)
+
+    def _flatten(self, root):
+        """Превращает корневой элемент с вложенными в плоские записи."""
+        stack = [(root, None, 0)]
+        while stack:
+            item, parent_id, depth = stack.pop()
+            record = {key: value for key, value in item.items() if key != "children"}
+            record["parent"] = parent_id
+            record["depth"] = depth
+            if item["type"] == "note":
+                self.report.notes += 1
+            else:
+                self.report.tasks += 1
+            yield record
+            if item["type"] == "note":
+                stack.extend((child, item["id"], depth + 1) for child in reversed(item["children"]))
+
+
+def _string(token):
+    """Значение строковой лексемы (в кавычках); испорченные байты заменяются."""
+    if b"\\" not in token:
+        return token[1:-1].decode("utf-8", "replace")
+    try:
+        return json.loads(token)
+    except ValueError:  # Неверная escape-последовательность или не UTF-8
+        return token[1:-1].decode("utf-8", "replace")
+
+
+def _depth(prefix):
+    """Уровень скобки по отступу перед ней (снимки pretty пишутся с отступом INDENT).
+
+    None, если скобка не в начале строки или отступ не кратен INDENT.
+    """
+    newline = prefix.rfind(b"\n")
+    if newline == -1:
+        return None
+    indent = prefix[newline + 1:]
+    if indent.strip(b" ") or len(indent) % INDENT:
+        return None
+    return len(indent) // INDENT
+
+
+def _number(token):
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def layout_from_records(records):
+    """Собирает данные формата файла из плоских записей (родитель идет раньше вложенных)."""
+    layout = {"notes": [], "tasks": []}
+    notes = {}
+    for record in records:
+        parent_id = record.pop("parent", None)
+        record.pop("depth", None)
+        if record["type"] == "note":
+            record["children"] = []
+            notes[record["id"]] = record
+        if parent_id in notes:
+            notes[parent_id]["children"].append(record)
+        else:
+            layout["notes" if record["type"] == "note" else "tasks"].append(record)
+    return layout
@@ -0,0 +1,192 @@
+"""Индексы для поиска и фильтрации заметок и задач."""
+import bisect
+import json
+import os
+import re
+
+TOKEN_RE = re.compile(r"\w+")  # \w понимает кириллицу
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре (ё считается равной е)."""
+    return TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+class SearchIndex:
+    """Обратный индекс: слово -> множество id элементов.
+
+    Индекс обновляется по одному элементу (add/remove), а отсортированный словарь
+    позволяет искать по началу слова без перебора всех слов.
+    """
+
+    def __init__(self):
+        self.postings = {}  # слово -> set(id)
+        self.doc_tokens = {}  # id -> set(слов), чтобы удалять элемент без его старого текста
+        self.vocabulary = []  # отсортированный список слов
+
+    @classmethod
+    def build(cls, documents):
+        """Строит индекс по парам (id, текст) целиком.
+
+        Словарь сортируется один раз в конце: вставка каждого нового слова через add
+        делала бы построение квадратичным по числу слов.
+        """
+        index = cls()
+        for item_id, text in documents:
+            tokens = set(tokenize(text))
+            index.doc_tokens[item_id] = tokens
+            for token in tokens:
+                ids = index.postings.get(token)
+                if ids is None:
+                    index.postings[token] = {item_id}
+                else:
+                    ids.add(item_id)
+        index.vocabulary = sorted(index.postings)
+        return index
+
+    def add(self, item_id, text):
+        """Добавляет (или переиндексирует) элемент."""
+        self.remove(item_id)
+        tokens = set(tokenize(text))
+        self.doc_tokens[item_id] = tokens
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = {item_id}
+                bisect.insort(self.vocabulary, token)
+            else:
+                ids.add(item_id)
+
+    def remove(self, item_id):
+        """Удаляет элемент из индекса."""
+        for token in self.doc_tokens.pop(item_id, ()):
+            ids = self.postings[token]
+            ids.discard(item_id)
+            if not ids:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def search(self, query):
+        """Возвращает id элементов, содержащих все слова запроса (каждое - как начало слова)."""
+        result = None
+        for prefix in set(tokenize(query)):
+            matches = set()
+            position = bisect.bisect_left(self.vocabulary, prefix)
+            while position < len(self.vocabulary) and self.vocabulary[position].startswith(prefix):
+                matches |= self.postings[self.vocabulary[position]]
+                position += 1
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result or set()
+
+    def save(self, path, stamp):
+        """Сохраняет индекс в файл вместе с отметкой о состоянии данных."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"stamp": stamp, "postings": {token: list(ids) for token, ids in self.postings.items()}},
+                      f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, stamp):
+        """Загружает индекс из файла. Возвращает None, если файла нет или он устарел."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if saved.get("stamp") != stamp:
+            return None
+
+        index = cls()
+        for token, ids in saved["postings"].items():
+            index.postings[token] = set(ids)
+            for item_id in ids:
+                index.doc_tokens.setdefault(item_id, set()).add(token)
+        index.vocabulary = sorted(index.postings)
+        return index
+
+
+class AttributeIndex:
+    """Вторичные индексы по значениям полей: поле -> значение -> множество id.
+
+    Позволяют отвечать на запросы вида "все задачи с высоким приоритетом в процессе"
+    пересечением множеств, без обхода дерева.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.index = {field: {} for field in self.fields}
+        self.values = {}  # id -> проиндексированные значения (чтобы удалять без старых данных)
+
+    def __contains__(self, item_id):
+        return item_id in self.values
+
+    def add(self, item_id, item):
+        """Добавляет (или переиндексирует) элемент."""
+        self.remove(item_id)
+        values = tuple(getattr(item, field) for field in self.fields)
+        self.values[item_id] = values
+        for field, value in zip(self.fields, values):
+            self.index[field].setdefault(value, set()).add(item_id)
+
+    def remove(self, item_id):
+        """Удаляет элемент из индексов."""
+        values = self.values.pop(item_id, None)
+        if values is None:
+            return
+        for field, value in zip(self.fields, values):
+            ids = self.index[field][value]
+            ids.discard(item_id)
+            if not ids:
+                del self.index[field][value]
+
+    def save(self, path, stamp):
+        """Сохраняет индекс в файл вместе с отметкой о состоянии данных."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"stamp": stamp, "fields": self.fields, "values": self.values}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, stamp, fields):
+        """Загружает индекс из файла. Возвращает None, если файла нет, он устарел или в нем другие поля.
+
+        Значения читаются в том виде, в каком они лежат в JSON (Status и Priority - числами,
+        которые равны соответствующим значениям перечислений).
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if saved.get("stamp") != stamp or tuple(saved.get("fields", ())) != tuple(fields):
+            return None
+
+        index = cls(fields)
+        for item_id, values in saved["values"].items():
+            values = tuple(values)
+            index.values[item_id] = values
+            for field, value in zip(index.fields, values):
+                index.index[field].setdefault(value, set()).add(item_id)
+        return index
+
+    def query(self, conditions):
+        """Возвращает id элементов, подходящих под все условия.
+
+        conditions - словарь поле -> набор допустимых значений.
+        """
+        matches = []
+        for field, allowed in conditions.items():
+            ids = set()
+            for value in allowed:
+                ids |= self.index[field].get(value, set())
+            matches.append(ids)
+        if not matches:
+            return set()
+        matches.sort(key=len)  # Пересекаем, начиная с самого маленького множества
+        result = set(matches[0])
+        for ids in matches[1:]:
+            result &= ids
+        return result
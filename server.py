@@ -0,0 +1,183 @@
+"""Сервер и клиент note.py.
+
+Сервер (note.py --serve) один раз загружает данные и держит их в памяти, а клиенты
+подключаются к нему через Unix-сокет. Команды выполняются по одной в цикле событий
+asyncio, поэтому изменения от нескольких клиентов не перемешиваются и не затирают
+друг друга. У каждого клиента своя сессия (текущая заметка и страница), а история
+отмены (u / r) общая: отменяется последнее изменение, кто бы его ни сделал.
+
+Протокол - по одной строке JSON на запрос и на ответ:
+    {"command": "<строка команды>"} -> {"output": "<вывод команды и экрана>", "running": true|false}
+    {"screen": true}                -> {"output": "<экран>", "running": true}
+    {"item": "<индекс>"}            -> {"type": ..., "status": ..., "priority": ...} или {"output": "<ошибка>"}
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shlex
+import signal
+import socket
+
+import note
+
+
+def available():
+    """Есть ли на этой платформе Unix-сокеты."""
+    return hasattr(socket, "AF_UNIX")
+
+
+def connect(path):
+    """Подключается к работающему серверу. Возвращает сокет или None, если сервера нет."""
+    if not available() or not os.path.exists(path):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return None  # Файл сокета остался от сервера, который уже не работает
+    return connection
+
+
+def captured(func, *args):
+    """Вызывает функцию note.py под блокировкой данных. Возвращает (результат, ее вывод)."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), note.storage_lock():
+        result = func(*args)
+    return result, output.getvalue()
+
+
+def handle_request(session, request):
+    """Выполняет один запрос клиента и возвращает ответ."""
+    removed = session.restore_context()  # Текущую заметку мог удалить другой клиент
+    notice = f"Заметка '{removed.title}' удалена другим клиентом.\n" if removed is not None else ""
+    if "command" in request:
+        running, output = captured(note.execute_command, session, request["command"])
+        if running:
+            output += captured(note.display_screen, session)[1]
+        return {"output": notice + output, "running": running}
+    if "item" in request:
+        (item, item_type), output = captured(note.get_item_by_index, session.data, request["item"], session.context)
+        if item is None:
+            return {"output": notice + output}
+        return {"type": item_type, "status": item.status.label, "priority": item.priority.label}
+    return {"output": notice + captured(note.display_screen, session)[1], "running": True}
+
+
+async def handle_client(data, reader, writer):
+    """Обслуживает одно подключение клиента."""
+    session = note.Session(data)
+    session.interactive = False  # Вопросы задает клиент, а не сервер
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                reply = handle_request(session, json.loads(line))
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                reply = {"output": "Ошибка: Некорректный запрос.\n", "running": True}
+            writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            if reply.get("running") is False:
+                break
+    except ConnectionError:
+        pass  # Клиент отключился посреди запроса
+    finally:
+        writer.close()
+
+
+async def run_server(data, path):
+    """Принимает подключения, пока процесс не получит SIGINT или SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    server = await asyncio.start_unix_server(lambda reader, writer: handle_client(data, reader, writer), path)
+    async with server:
+        await stop.wait()
+
+
+def serve(backend, path, codec=note.SNAPSHOT_CODEC):
+    """Загружает данные и обслуживает клиентов до остановки сервера."""
+    if not available():
+        print("Ошибка: Режим сервера требует Unix-сокетов, а на этой платформе их нет.")
+        return
+    connection = connect(path)
+    if connection is not None:
+        connection.close()
+        print(f"Ошибка: Сервер уже запущен ({path}).")
+        return
+    if os.path.exists(path):
+        os.remove(path)
+
+    note.open_storage(backend, codec)
+    data = note.load_data()
+    print(f"Сервер запущен: {path}. Остановка - Ctrl+C.")
+    try:
+        asyncio.run(run_server(data, path))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        note.close_storage()
+        print("Сервер остановлен.")
+
+
+class Client:
+    """Подключение к серверу: отправляет запросы и читает ответы."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.stream = connection.makefile("rwb")
+
+    def request(self, **request):
+        """Отправляет запрос и возвращает ответ сервера."""
+        self.stream.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("сервер закрыл соединение")
+        return json.loads(line)
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+def edit_command(client, index):
+    """Спрашивает новые значения полей (как локальный e <индекс>) и строит команду с ними."""
+    reply = client.request(item=index)
+    if "type" not in reply:
+        print(reply["output"], end="")
+        return None
+    fields = note.ask_edit_fields(reply["type"], reply["status"], reply["priority"])
+    return f"e {index} " + " ".join(f"{field}={shlex.quote(value)}" for field, value in fields.items())
+
+
+def run_client(connection):
+    """Цикл команд, которые выполняет сервер."""
+    client = Client(connection)
+    try:
+        print(client.request(screen=True)["output"], end="")
+        while True:
+            try:
+                line = input("Введите команду: ")
+            except (EOFError, KeyboardInterrupt):
+                print("\nВыход.")
+                break
+            command = line.split()
+            if len(command) == 2 and command[0] == "e":
+                line = edit_command(client, command[1])
+                if line is None:
+                    continue
+            reply = client.request(command=line)
+            print(reply["output"], end="")
+            if not reply["running"]:
+                print("Выход.")
+                break
+    except ConnectionError:
+        print("Ошибка: Соединение с сервером потеряно.")
+    finally:
+        client.close()
@@ -0,0 +1,122 @@
+"""Форматы файла снимка (notes.json).
+
+    pretty  - JSON с отступами, как раньше (удобно читать глазами)
+    compact - JSON без пробелов
+    orjson  - компактный JSON через библиотеку orjson (если установлена)
+    binary  - записи с префиксом длины и оглавлением в конце файла
+
+Формат при чтении определяется по первым байтам, поэтому смена формата не требует
+переноса данных: следующий снимок просто будет записан в новом формате.
+
+Двоичный формат: MAGIC, затем для каждого корневого элемента (сначала заметки, потом
+задачи) 4 байта длины и сам элемент с вложенными в компактном JSON, затем оглавление
+(JSON-список [id, "notes"|"tasks", смещение, длина]) и в конце FOOTER: смещение и длина
+оглавления и еще раз MAGIC. Через оглавление одно поддерево читается из отображенного в
+память файла (read_root_item) без разбора остальных.
+"""
+import json
+import mmap
+import struct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAGIC = b"NOTEBIN1"
+LENGTH = struct.Struct("<I")  # Префикс длины записи
+FOOTER = struct.Struct("<QI8s")  # Смещение оглавления, его длина, MAGIC
+
+CODECS = ("pretty", "compact", "orjson", "binary")
+
+
+def available_codecs():
+    """Возвращает форматы, которыми можно писать в этой установке."""
+    return tuple(codec for codec in CODECS if codec != "orjson" or orjson is not None)
+
+
+def _dumps(value):
+    """Компактный JSON в байтах."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def encode(layout, codec):
+    """Превращает данные формата файла в байты снимка."""
+    if codec == "pretty":
+        # ensure_ascii=False для корректного отображения кириллицы
+        return json.dumps(layout, indent=4, ensure_ascii=False).encode("utf-8")
+    if codec == "compact":
+        return json.dumps(layout, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if codec == "orjson":
+        if orjson is None:
+            raise ValueError("библиотека orjson не установлена")
+        return orjson.dumps(layout)
+    if codec == "binary":
+        return encode_binary(layout)
+    raise ValueError(f"неизвестный формат снимка: {codec}")
+
+
+def decode(payload):
+    """Разбирает байты снимка любого формата (формат определяется по началу файла).
+
+    При повреждении бросает ValueError (json.JSONDecodeError - его подкласс).
+    """
+    if payload[:len(MAGIC)] == MAGIC:
+        return decode_binary(payload)
+    return _loads(payload)
+
+
+def encode_binary(layout):
+    """Записывает данные в двоичном формате."""
+    parts = [MAGIC]
+    index = []
+    offset = len(MAGIC)
+    for kind in ("notes", "tasks"):
+        for item in layout[kind]:
+            payload = _dumps(item)
+            parts.append(LENGTH.pack(len(payload)))
+            parts.append(payload)
+            index.append([item["id"], kind, offset + LENGTH.size, len(payload)])
+            offset += LENGTH.size + len(payload)
+    table = _dumps(index)
+    parts.append(table)
+    parts.append(FOOTER.pack(offset, len(table), MAGIC))
+    return b"".join(parts)
+
+
+def read_index(buffer):
+    """Читает оглавление двоичного снимка (bytes или mmap)."""
+    if len(buffer) < len(MAGIC) + FOOTER.size or buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError("это не двоичный снимок")
+    offset, length, magic = FOOTER.unpack_from(buffer, len(buffer) - FOOTER.size)
+    if magic != MAGIC or offset + length > len(buffer) - FOOTER.size:
+        raise ValueError("оглавление двоичного снимка повреждено")
+    return _loads(buffer[offset:offset + length])
+
+
+def decode_binary(buffer):
+    """Разбирает весь двоичный снимок."""
+    layout = {"notes": [], "tasks": []}
+    for _, kind, offset, length in read_index(buffer):
+        layout[kind].append(_loads(buffer[offset:offset + length]))
+    return layout
+
+
+def read_root_item(path, item_id):
+    """Читает из двоичного снимка один корневой элемент с вложенными (None, если его нет).
+
+    Файл отображается в память, и разбираются только оглавление и запись элемента.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        for record_id, _, offset, length in read_index(buffer):
+            if record_id == item_id:
+                return _loads(buffer[offset:offset + length])
+    return None
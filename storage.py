@@ -0,0 +1,1077 @@
+"""Хранилища данных для note.py.
+
+Все хранилища работают с данными в формате JSON-файла: {"notes": [...], "tasks": [...]},
+где элементы - словари, а вложенные элементы заметки лежат в "children". Методы, которым
+может понадобиться снимок (commit, end_batch), получают объект snapshot, который строит
+его только при необходимости: snapshot() - весь снимок, snapshot.note(id) - одна корневая
+заметка с вложенными, snapshot.tasks() - корневые задачи, snapshot.note_ids() - порядок
+корневых заметок.
+
+У каждого хранилища есть блокировка lock (threading.RLock), под которой вызывающий код
+меняет данные и вызывает record и commit. Фоновая запись JsonStorage строит снимок под
+ней же; остальным хранилищам она не нужна, но есть, чтобы код вокруг не зависел от вида
+хранилища.
+"""
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+from recovery import Salvage, layout_from_records
+from snapshots import decode, encode
+
+
+def new_id():
+    """Возвращает новый уникальный идентификатор элемента."""
+    return uuid.uuid4().hex
+
+
+def empty_data():
+    """Возвращает пустую структуру данных."""
+    return {"notes": [], "tasks": []}
+
+
+def iter_tree(items):
+    """Обходит элементы и все вложенные в них элементы (без рекурсии)."""
+    stack = list(reversed(items))
+    while stack:
+        item = stack.pop()
+        yield item
+        if "children" in item:
+            stack.extend(reversed(item["children"]))
+
+
+def assign_missing_ids(data):
+    """Выдает идентификаторы элементам, у которых их еще нет. Возвращает True, если что-то изменилось."""
+    changed = False
+    for item in iter_tree(data["notes"] + data["tasks"]):
+        if "id" not in item:
+            item["id"] = new_id()
+            changed = True
+    return changed
+
+
+def _fsync_directory(path):
+    """Сбрасывает на диск запись каталога, чтобы переименование файла пережило сбой питания."""
+    if os.name == "nt":
+        return  # В Windows каталог нельзя открыть для fsync
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rotate_generations(path, generations):
+    """Сдвигает резервные копии path.1 .. path.N и делает текущий файл копией path.1."""
+    if generations <= 0 or not os.path.exists(path):
+        return
+    for number in range(generations - 1, 0, -1):
+        older = f"{path}.{number}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{number + 1}")
+    first = f"{path}.1"
+    if os.path.exists(first):
+        os.remove(first)
+    try:
+        os.link(path, first)  # Жесткая ссылка: сам файл остается на месте до замены
+    except OSError:
+        shutil.copy2(path, first)
+
+
+def atomic_write(path, payload, generations=0):
+    """Записывает байты в файл так, что при сбое остается либо старая, либо новая версия.
+
+    Данные пишутся во временный файл, сбрасываются на диск (fsync) и только потом
+    переименовываются поверх path. Перед заменой предыдущая версия сохраняется как
+    path.1 (до generations копий). Возвращает {"bytes", "write", "fsync"} (время в секундах).
+    """
+    temp_path = path + ".tmp"
+    started = time.perf_counter()
+    with open(temp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        written = time.perf_counter()
+        os.fsync(f.fileno())
+    synced = time.perf_counter()
+    rotate_generations(path, generations)
+    os.replace(temp_path, path)
+    _fsync_directory(path)
+    return {"bytes": len(payload), "write": written - started, "fsync": synced - written}
+
+
+class BackgroundSaver:
+    """Фоновый поток записи снимков.
+
+    schedule() только запоминает последнюю функцию снимка и откладывает запись на delay
+    секунд: несколько изменений подряд сливаются в одну запись. Но не дольше max_wait
+    (по умолчанию 10 * delay) с первого еще не записанного изменения, иначе при непрерывном
+    потоке команд снимок не писался бы вовсе, а журнал рос бы без конца. Сама запись
+    (write) идет в отдельном потоке, поэтому команды не ждут диска.
+    """
+
+    def __init__(self, write, delay=0.5, max_wait=None):
+        self.write = write
+        self.delay = delay
+        self.max_wait = max_wait if max_wait is not None else 10 * delay
+        self._condition = threading.Condition()
+        self._pending = None  # Функция снимка, который еще нужно записать
+        self._deadline = 0.0  # Позже этого записывать нельзя (отсчитывается от первого изменения)
+        self._due = 0.0  # Когда записывать (time.monotonic)
+        self._writing = False
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="note-saver", daemon=True)
+        self._thread.start()
+
+    def schedule(self, snapshot):
+        """Ставит снимок в очередь на запись (заменяя еще не записанный)."""
+        with self._condition:
+            now = time.monotonic()
+            if self._pending is None:
+                self._deadline = now + self.max_wait
+            self._pending = snapshot
+            self._due = min(now + self.delay, self._deadline)
+            self._condition.notify_all()
+
+    def flush(self):
+        """Записывает отложенный снимок немедленно и ждет окончания записи."""
+        with self._condition:
+            self._due = 0.0
+            self._condition.notify_all()
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+
+    def stop(self):
+        """Записывает отложенный снимок и останавливает поток."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        with self._condition:
+            while True:
+                while self._pending is None and not self._stopping:
+                    self._condition.wait()
+                if self._pending is None:
+                    return  # Остановка, записывать нечего
+                # Ждем, пока изменения не перестанут поступать
+                while not self._stopping and self._due > time.monotonic():
+                    self._condition.wait(self._due - time.monotonic())
+                snapshot, self._pending = self._pending, None
+                self._writing = True
+                self._condition.release()
+                try:
+                    self.write(snapshot)
+                except Exception as error:  # Поток не должен молча умирать: следующая запись может пройти
+                    print(f"Ошибка: Не удалось сохранить данные: {error}")
+                finally:
+                    self._condition.acquire()
+                    self._writing = False
+                    self._condition.notify_all()
+
+
+class JsonStorage:
+    """Снимок в JSON-файле плюс журнал операций.
+
+    Изменения дописываются в журнал короткими записями, а снимок пересобирается только
+    когда журнал становится больше compact_size. Если journal_path равен None, весь файл
+    сохраняется после каждой команды.
+
+    Снимок записывается атомарно (atomic_write), предыдущие generations версий остаются
+    рядом как path.1, path.2, ... и используются, если основной файл не читается. С
+    save_delay снимки после команд пишет фоновый поток; пока он строит снимок, он держит
+    lock, поэтому код, меняющий данные, должен брать ту же блокировку. Формат снимка
+    задает codec (см. snapshots.py).
+    """
+
+    lazy = False  # Все данные загружаются сразу
+    on_write = None  # Функция, которой передаются сведения о каждой записи снимка (для замеров)
+
+    def __init__(self, path, journal_path=None, compact_size=1024 * 1024, generations=3, save_delay=None,
+                 codec="pretty"):
+        self.path = path
+        self.codec = codec  # Формат, в котором пишутся снимки (читаются любые, см. snapshots.py)
+        self.journal_path = journal_path
+        self.compact_size = compact_size
+        self.generations = generations
+        self.lock = threading.RLock()
+        self._journal = None
+        self._batch = False  # Пакетный режим: журнал не ведется, снимок пишется один раз в конце
+        self._restored = False  # Снимок загружен не из основного файла (см. load_snapshot)
+        self._saver = BackgroundSaver(self._write_snapshot, save_delay) if save_delay is not None else None
+
+    def load(self):
+        """Загружает снимок данных и применяет к нему операции из журнала."""
+        self._restored = False
+        data = self.load_snapshot()
+        if assign_missing_ids(data) or self._restored:
+            # Старый файл без идентификаторов: журнал ссылается на элементы по id,
+            # поэтому выданные идентификаторы нужно сразу записать в снимок. Так же
+            # сразу записываются данные из резервной копии или спасенные из поврежденного
+            # файла: основного файла больше нет, и без снимка они остались бы только в памяти.
+            self.replay_journal(data)
+            self.save(data)
+        else:
+            self.replay_journal(data)
+        return data
+
+    def load_snapshot(self):
+        """Загружает данные из файла снимка, а если он поврежден - из последней целой резервной копии.
+
+        Поврежденный файл переименовывается в path.damaged и больше не перезаписывается.
+        Если целых копий нет, из него спасается все, что удается разобрать (salvage_file).
+        """
+        if not os.path.exists(self.path):
+            return empty_data()
+        try:
+            with open(self.path, "rb") as f:
+                return decode(f.read())
+        except ValueError:  # JSONDecodeError, UnicodeDecodeError и ошибки двоичного формата
+            pass
+        damaged = unused_path(self.path + ".damaged")
+        os.replace(self.path, damaged)
+        self._restored = True
+        print(f"Ошибка: Файл данных поврежден и сохранен как {damaged}.")
+        for number in range(1, self.generations + 1):
+            backup = f"{self.path}.{number}"
+            if not os.path.exists(backup):
+                continue
+            try:
+                with open(backup, "rb") as f:
+                    data = decode(f.read())
+            except ValueError:
+                continue
+            print(f"Загружена резервная копия {backup}. Изменения, которых в ней нет, "
+                  f"можно попробовать спасти: note.py --recover {damaged}")
+            return data
+        recovered = unused_path(recovered_path(self.path))
+        print("Целых резервных копий нет, спасаем данные из поврежденного файла...")
+        salvage_file(damaged, recovered)
+        return layout_from_records(read_ndjson(recovered))
+
+    def load_children(self, note_id):
+        """Все вложенные элементы загружаются вместе со снимком."""
+        return []
+
+    def stamp(self):
+        """Возвращает отметку о состоянии файлов (меняется при любой записи)."""
+        stamp = []
+        for path in (self.path, self.journal_path, self._old_journal_path()):
+            if path is not None and os.path.exists(path):
+                stat = os.stat(path)
+                stamp += [stat.st_mtime_ns, stat.st_size]
+            else:
+                stamp += [0, 0]
+        return stamp
+
+    def save(self, data):
+        """Сохраняет данные в файл снимка и очищает журнал."""
+        if self._saver is not None:
+            self._saver.flush()  # Отложенный снимок старее этих данных
+        with self.lock:
+            self._write_file(data)
+            self.reset_journal()
+
+    def _write_file(self, data):
+        """Атомарно записывает снимок в файл."""
+        started = time.perf_counter()
+        payload = encode(data, self.codec)
+        serialized = time.perf_counter()
+        stats = atomic_write(self.path, payload, self.generations)
+        stats["serialize"] = serialized - started
+        if self.on_write is not None:
+            self.on_write(stats)
+        return stats
+
+    def _write_snapshot(self, snapshot):
+        """Строит и записывает снимок в фоновом потоке.
+
+        Снимок строится и журнал откладывается в сторону (.old) под блокировкой, так что
+        операции после этого момента попадают уже в новый журнал. Отложенный журнал
+        удаляется только после записи снимка: при сбое он будет применен при загрузке.
+        """
+        with self.lock:
+            data = snapshot()
+            self._set_journal_aside()
+        self._write_file(data)
+        old_path = self._old_journal_path()
+        if old_path is not None and os.path.exists(old_path):
+            os.remove(old_path)
+
+    def _old_journal_path(self):
+        return self.journal_path + ".old" if self.journal_path is not None else None
+
+    def _set_journal_aside(self):
+        """Переносит текущий журнал в .old (дописывая, если там остался журнал после сбоя)."""
+        if self.journal_path is None:
+            return
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not os.path.exists(self.journal_path):
+            return
+        old_path = self._old_journal_path()
+        if os.path.exists(old_path):
+            with open(self.journal_path, "rb") as source, open(old_path, "ab") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, old_path)
+
+    def record(self, op):
+        """Дописывает запись об операции в журнал (если журнал ведется)."""
+        if self.journal_path is None or self._batch:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(op, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+    def commit(self, snapshot):
+        """Фиксирует изменения после команды.
+
+        В режиме журнала операции уже записаны, и снимок пересобирается только когда журнал
+        вырос больше compact_size. Без журнала весь файл сохраняется сразу.
+        """
+        if self._batch:
+            return
+        if self.journal_path is None or (self._journal is not None and self._journal.tell() > self.compact_size):
+            if self._saver is not None:
+                self._saver.schedule(snapshot)
+            else:
+                self.save(snapshot())
+
+    def begin_batch(self):
+        """Начинает пакет изменений: до end_batch ничего не записывается."""
+        self._batch = True
+
+    def end_batch(self, snapshot):
+        """Завершает пакет изменений, записывая один снимок."""
+        self._batch = False
+        self.save(snapshot())
+
+    def close(self):
+        """Дописывает отложенный снимок и закрывает журнал операций."""
+        if self._saver is not None:
+            self._saver.stop()
+            self._saver = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def reset_journal(self):
+        """Очищает журнал после того, как все его операции попали в снимок."""
+        if self._journal is not None:
+            self._journal.seek(0)
+            self._journal.truncate()
+        elif self.journal_path is not None and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        old_path = self._old_journal_path()
+        if old_path is not None and os.path.exists(old_path):
+            os.remove(old_path)
+
+    def replay_journal(self, data):
+        """Применяет к данным операции из журнала. Возвращает число примененных операций.
+
+        Повторное применение операции безопасно: добавление элемента с уже существующим id
+        и удаление отсутствующего элемента пропускаются, поэтому сбой между записью снимка
+        и очисткой журнала ничего не портит.
+        """
+        if self.journal_path is None:
+            return 0
+        # Журнал, отложенный фоновым сохранением, старше текущего
+        paths = [path for path in (self._old_journal_path(), self.journal_path) if os.path.exists(path)]
+        if not paths:
+            return 0
+
+        # id -> (элемент, список, в котором он лежит)
+        index = {}
+        for container in (data["notes"], data["tasks"]):
+            for item in container:
+                index[item["id"]] = (item, container)
+        for item in iter_tree(data["notes"]):
+            for child in item.get("children", []):
+                index[child["id"]] = (child, item["children"])
+
+        applied = 0
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная запись в конце журнала (сбой во время дописывания).
+                        print("Предупреждение: Журнал операций поврежден, остаток журнала пропущен.")
+                        break
+
+                    kind = op.get("op")
+                    if kind == "add":
+                        item = op["item"]
+                        if item["id"] in index:
+                            continue
+                        if op["parent"] is None:
+                            container = data["notes"] if item["type"] == "note" else data["tasks"]
+                        elif op["parent"] in index:
+                            container = index[op["parent"]][0]["children"]
+                        else:
+                            continue  # Родитель был удален
+                        if op.get("position") is None:
+                            container.append(item)
+                        else:
+                            container.insert(op["position"], item)  # Отмена удаления: на прежнее место
+                        index[item["id"]] = (item, container)
+                        for child_item in iter_tree([item]):
+                            for child in child_item.get("children", []):
+                                index[child["id"]] = (child, child_item["children"])
+                    elif kind == "edit":
+                        if op["id"] in index:
+                            index[op["id"]][0].update(op["fields"])
+                    elif kind == "delete":
+                        if op["id"] in index:
+                            item, container = index.pop(op["id"])
+                            for i, other in enumerate(container):
+                                if other is item:
+                                    del container[i]
+                                    break
+                    else:
+                        continue
+                    applied += 1
+        return applied
+
+
+class SqliteStorage:
+    """Хранилище в базе SQLite: одна строка на элемент.
+
+    При загрузке читается только корневой уровень, вложенные элементы заметки читаются
+    при первом входе в нее (load_children). Каждая операция меняет только свои строки.
+    """
+
+    lazy = True  # Вложенные элементы загружаются по требованию
+    on_write = None  # Не вызывается: снимков нет, каждая команда - своя транзакция
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            id TEXT PRIMARY KEY,
+            parent_id TEXT REFERENCES items(id) ON DELETE CASCADE,
+            type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            body TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            position INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS items_parent ON items(parent_id, position);
+    """
+
+    # Поле элемента -> столбец таблицы
+    COLUMNS = {"title": "title", "content": "body", "description": "body", "status": "status",
+               "priority": "priority"}
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA foreign_keys = ON")  # Удаление заметки удаляет и ее содержимое
+        self.conn.executescript(self.SCHEMA)
+        self.lock = threading.RLock()
+        self._pending = set()  # Заметки, вложенные элементы которых еще не прочитаны
+        self._batch = False  # Пакетный режим: одна транзакция на весь пакет
+
+    def load(self):
+        """Загружает корневой уровень."""
+        data = empty_data()
+        for item in self._fetch_children(None):
+            data["notes" if item["type"] == "note" else "tasks"].append(item)
+        return data
+
+    def load_children(self, note_id):
+        """Возвращает вложенные элементы заметки, если они еще не были прочитаны."""
+        if note_id not in self._pending:
+            return []
+        self._pending.discard(note_id)
+        return self._fetch_children(note_id)
+
+    def ancestors(self, item_id):
+        """Возвращает id заметок на пути от корня к элементу (не включая сам элемент)."""
+        rows = self.conn.execute(
+            """WITH RECURSIVE path(id, parent_id, depth) AS (
+                   SELECT id, parent_id, 0 FROM items WHERE id = ?
+                   UNION ALL
+                   SELECT items.id, items.parent_id, path.depth + 1 FROM items JOIN path ON items.id = path.parent_id
+               )
+               SELECT id FROM path WHERE depth > 0 ORDER BY depth DESC""", (item_id,))
+        return [row[0] for row in rows]
+
+    def iter_items(self):
+        """Обходит все элементы базы, не загружая их в дерево (для построения индексов)."""
+        rows = self.conn.execute("SELECT id, type, title, body, status, priority FROM items")
+        for item_id, item_type, title, body, status, priority in rows:
+            yield {"id": item_id, "type": item_type, "title": title,
+                   "content" if item_type == "note" else "description": body,
+                   "status": status, "priority": priority}
+
+    def subtree_counts(self):
+        """Возвращает строки (id заметки, статус, приоритет, количество) по всем вложенным элементам.
+
+        Каждый элемент засчитывается всем заметкам на пути к нему от корня.
+        """
+        return self.conn.execute(
+            """WITH RECURSIVE up(ancestor, status, priority) AS (
+                   SELECT parent_id, status, priority FROM items WHERE parent_id IS NOT NULL
+                   UNION ALL
+                   SELECT items.parent_id, up.status, up.priority FROM up JOIN items ON items.id = up.ancestor
+                   WHERE items.parent_id IS NOT NULL
+               )
+               SELECT ancestor, status, priority, COUNT(*) FROM up GROUP BY ancestor, status, priority""").fetchall()
+
+    def stamp(self):
+        """Возвращает отметку о состоянии файла базы (меняется при любой записи)."""
+        stat = os.stat(self.path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _fetch_children(self, parent_id):
+        rows = self.conn.execute(
+            "SELECT id, type, title, body, status, priority FROM items WHERE parent_id IS ? ORDER BY position",
+            (parent_id,))
+        items = []
+        for item_id, item_type, title, body, status, priority in rows:
+            if item_type == "note":
+                items.append({"id": item_id, "type": "note", "title": title, "content": body, "children": [],
+                              "status": status, "priority": priority})
+                self._pending.add(item_id)
+            else:
+                items.append({"id": item_id, "type": "task", "title": title, "description": body,
+                              "status": status, "priority": priority})
+        return items
+
+    def save(self, data):
+        """Полностью перезаписывает базу данными из памяти."""
+        self.conn.execute("DELETE FROM items")
+        for position, item in enumerate(data["notes"] + data["tasks"]):
+            self._insert(item, None, position)
+        self.conn.commit()
+
+    def _insert(self, item, parent_id, position=None):
+        """Добавляет строку элемента (и строки всех его вложенных элементов).
+
+        Обход идет по явному стеку, а не рекурсией, поэтому глубина вложенности не ограничена.
+        """
+        if position is None:
+            position = self.conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM items WHERE parent_id IS ?", (parent_id,)).fetchone()[0]
+        stack = [(item, parent_id, position)]
+        while stack:
+            node, node_parent_id, node_position = stack.pop()
+            body = node.get("content", "") if node["type"] == "note" else node.get("description", "")
+            self.conn.execute(
+                "INSERT INTO items (id, parent_id, type, title, body, status, priority, position)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (node["id"], node_parent_id, node["type"], node["title"], body, node["status"], node["priority"],
+                 node_position))
+            # Родитель вставлен раньше вложенных (внешний ключ), порядок соседей задает position
+            stack.extend((child, node["id"], child_position)
+                         for child_position, child in enumerate(node.get("children", [])))
+
+    def _make_room(self, parent_id, item_type, index):
+        """Сдвигает соседей, освобождая место index в списке уровня. Возвращает position (None - в конец)."""
+        if parent_id is None:
+            # В памяти заметки и задачи корневого уровня лежат в разных списках
+            row = self.conn.execute(
+                "SELECT position FROM items WHERE parent_id IS NULL AND type = ? ORDER BY position LIMIT 1 OFFSET ?",
+                (item_type, index)).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT position FROM items WHERE parent_id = ? ORDER BY position LIMIT 1 OFFSET ?",
+                (parent_id, index)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute("UPDATE items SET position = position + 1 WHERE parent_id IS ? AND position >= ?",
+                          (parent_id, row[0]))
+        return row[0]
+
+    def record(self, op):
+        """Применяет операцию к строкам базы."""
+        kind = op["op"]
+        if kind == "add":
+            position = None
+            if op.get("position") is not None:
+                position = self._make_room(op["parent"], op["item"]["type"], op["position"])
+            self._insert(op["item"], op["parent"], position)
+        elif kind == "edit":
+            columns = [self.COLUMNS[field] for field in op["fields"]]
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            self.conn.execute(f"UPDATE items SET {assignments} WHERE id = ?", (*op["fields"].values(), op["id"]))
+        elif kind == "delete":
+            self.conn.execute("DELETE FROM items WHERE id = ?", (op["id"],))
+            self._pending.discard(op["id"])
+
+    def commit(self, snapshot):
+        """Фиксирует транзакцию после команды."""
+        if not self._batch:
+            self.conn.commit()
+
+    def begin_batch(self):
+        """Начинает пакет изменений: все операции попадут в одну транзакцию."""
+        self._batch = True
+
+    def end_batch(self, snapshot):
+        """Фиксирует транзакцию пакета."""
+        self._batch = False
+        self.conn.commit()
+
+    def close(self):
+        """Закрывает базу."""
+        self.conn.commit()
+        self.conn.close()
+
+
+def _parses(payload):
+    try:
+        json.loads(payload)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return False
+    return True
+
+
+def shard_counts(note):
+    """Возвращает сводку по содержимому заметки: [[статус, приоритет, количество], ...]."""
+    counts = collections.Counter((item["status"], item["priority"]) for item in iter_tree(note["children"]))
+    return [[status, priority, count] for (status, priority), count in counts.items()]
+
+
+def verify_shard(path, checksum):
+    """Проверяет файл шарда по контрольной сумме и при необходимости чинит его.
+
+    Возвращает (состояние, контрольная сумма файла после проверки). Состояния:
+    "ok" - файл совпадает с манифестом; "changed" - файл цел, но манифест не успел обновиться
+    (сбой между записью шарда и манифеста); "restored" - файл поврежден и заменен резервной
+    копией (сам он сохранен как .damaged); "lost" - целой версии нет. Выполняется в
+    отдельных процессах, поэтому функция модульная и работает только с файлами.
+    """
+    try:
+        with open(path, "rb") as f:
+            payload = f.read()
+    except FileNotFoundError:
+        payload = None
+    if payload is not None:
+        if hashlib.sha256(payload).hexdigest() == checksum:
+            return "ok", checksum
+        if _parses(payload):
+            return "changed", hashlib.sha256(payload).hexdigest()
+    backup = path + ".1"
+    if os.path.exists(backup):
+        with open(backup, "rb") as f:
+            saved = f.read()
+        if _parses(saved):
+            if payload is not None:
+                os.replace(path, unused_path(path + ".damaged"))
+            atomic_write(path, saved)
+            return "restored", hashlib.sha256(saved).hexdigest()
+    return "lost", None
+
+
+class ShardedStorage:
+    """Данные в каталоге: по файлу (шарду) на каждую корневую заметку, файл корневых задач
+    и небольшой манифест.
+
+    Манифест хранит порядок корневых заметок, их собственные поля (чтобы показать корневой
+    уровень, не открывая шарды), контрольные суммы и сводки по содержимому. Шард заметки
+    читается при первом входе в нее (load_children). Операции только помечают шарды
+    измененными, а commit переписывает лишь их и манифест. При загрузке шарды проверяются
+    по контрольным суммам параллельно в пуле процессов.
+    """
+
+    lazy = True  # Содержимое корневых заметок загружается по требованию
+    on_write = None  # Функция, которой передаются сведения о каждой записи файла (для замеров)
+
+    MANIFEST = "manifest.json"
+    TASKS = "tasks"  # Ключ шарда корневых задач (id заметок - шестнадцатеричные строки, не пересекаются)
+    PARALLEL_VERIFY_MIN = 16  # С меньшим числом шардов пул процессов дороже самой проверки
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self._entries = {}  # id корневой заметки -> запись манифеста (поля заметки, shard, checksum, counts)
+        self._tasks_checksum = None
+        self._shard_of = {}  # id элемента -> id корневой заметки (или TASKS), в шарде которой он лежит
+        self._pending = set()  # Корневые заметки, шарды которых еще не прочитаны
+        self._scanned = set()  # Непрочитанные шарды, в которых уже искали элементы (_find_shard)
+        self._dirty = set()  # Шарды, которые нужно переписать
+        self._removed = set()  # Корневые заметки, шарды которых нужно удалить
+        self._batch = False
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _shard_name(self, key):
+        return "tasks.json" if key == self.TASKS else f"{key}.json"
+
+    def load(self):
+        """Загружает манифест и корневые задачи, проверив шарды."""
+        rebuilt = self._load_manifest()
+        if self._verify() or rebuilt:
+            self._write_manifest(list(self._entries))
+        data = empty_data()
+        for note_id, entry in self._entries.items():
+            fields = {key: value for key, value in entry.items() if key not in ("shard", "checksum", "counts")}
+            fields["children"] = []
+            data["notes"].append(fields)
+            self._shard_of[note_id] = note_id
+            self._pending.add(note_id)
+        data["tasks"] = self._read_shard(self.TASKS, {"tasks": []})["tasks"]
+        for item in iter_tree(data["tasks"]):
+            self._shard_of[item["id"]] = self.TASKS
+        return data
+
+    def _load_manifest(self):
+        """Читает манифест (или его резервную копию, если он поврежден).
+
+        Возвращает True, если манифест пришлось собрать заново по файлам шардов.
+        """
+        path = self._path(self.MANIFEST)
+        for candidate in (path, path + ".1"):
+            if not os.path.exists(candidate):
+                continue
+            try:
+                with open(candidate, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                print(f"Ошибка: Манифест {candidate} поврежден.")
+                continue
+            if candidate != path:
+                print(f"Загружена резервная копия манифеста {candidate}.")
+            self._entries = {entry["id"]: entry for entry in manifest["notes"]}
+            self._tasks_checksum = manifest["tasks_checksum"]
+            return False
+        self._entries = {}
+        self._tasks_checksum = None
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(".json") and name not in (self.MANIFEST, self._shard_name(self.TASKS)))
+        if not (os.path.exists(path) or names):
+            return False  # Новое хранилище
+        self._rebuild_manifest(names)
+        return True
+
+    def _rebuild_manifest(self, names):
+        """Собирает записи манифеста по файлам шардов (порядок корневых заметок теряется)."""
+        for name in names:
+            try:
+                with open(self._path(name), "rb") as f:
+                    payload = f.read()
+                note = json.loads(payload)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue  # Такой шард проверка потом восстановит из копии или сообщит о потере
+            entry = {key: value for key, value in note.items() if key != "children"}
+            entry["shard"] = name
+            entry["checksum"] = hashlib.sha256(payload).hexdigest()
+            entry["counts"] = shard_counts(note)
+            self._entries[note["id"]] = entry
+        tasks_path = self._path(self._shard_name(self.TASKS))
+        if os.path.exists(tasks_path):
+            with open(tasks_path, "rb") as f:
+                self._tasks_checksum = hashlib.sha256(f.read()).hexdigest()
+        print(f"Манифест восстановлен по файлам шардов ({len(self._entries)} заметок), порядок заметок мог измениться.")
+
+    def _verify(self):
+        """Проверяет (и по возможности чинит) все шарды, при большом их числе - параллельно.
+
+        Возвращает True, если манифест нужно переписать.
+        """
+        keys = list(self._entries) + [self.TASKS]
+        if not os.path.exists(self._path(self._shard_name(self.TASKS))) and self._tasks_checksum is None:
+            keys.pop()  # Пустое хранилище: файла задач еще нет
+        paths = [self._path(self._shard_name(key)) for key in keys]
+        checksums = [self._tasks_checksum if key == self.TASKS else self._entries[key]["checksum"] for key in keys]
+        if len(keys) >= self.PARALLEL_VERIFY_MIN:
+            with concurrent.futures.ProcessPoolExecutor() as pool:
+                results = list(pool.map(verify_shard, paths, checksums, chunksize=max(1, len(keys) // 64)))
+        else:
+            results = [verify_shard(path, checksum) for path, checksum in zip(paths, checksums)]
+
+        problems = collections.Counter()
+        for key, (state, checksum) in zip(keys, results):
+            if state == "lost":
+                # Остаются только поля заметки из манифеста, поврежденный файл - рядом как .damaged
+                name = self._shard_name(key)
+                print(f"Ошибка: Шард {name} поврежден, а целой копии нет. Его содержимое потеряно.")
+                if os.path.exists(self._path(name)):
+                    os.replace(self._path(name), unused_path(self._path(name) + ".damaged"))
+                if key == self.TASKS:
+                    self._tasks_checksum = self._write_file(name, {"tasks": []})
+                else:
+                    fields = {field: value for field, value in self._entries[key].items()
+                              if field not in ("shard", "checksum", "counts")}
+                    self._write_note({**fields, "children": []})
+            elif key == self.TASKS:
+                self._tasks_checksum = checksum
+            elif state == "ok":
+                self._entries[key]["checksum"] = checksum
+            else:
+                # В файле теперь другое содержимое (копия или не попавшая в манифест запись):
+                # поля заметки и сводка в манифесте должны описывать именно его
+                note = self._read_shard(key, {"children": []})
+                entry = {field: value for field, value in note.items() if field != "children"}
+                entry.update(id=key, shard=self._shard_name(key), checksum=checksum, counts=shard_counts(note))
+                self._entries[key] = entry
+            if state != "ok":
+                problems[state] += 1
+        if problems:
+            print(f"Шарды: проверено {len(keys)}, исправлено контрольных сумм {problems['changed']}, "
+                  f"восстановлено из копии {problems['restored']}, потеряно {problems['lost']}.")
+        return bool(problems)
+
+    def _read_shard(self, key, default):
+        """Читает шард (default - если его нет)."""
+        path = self._path(self._shard_name(key))
+        if not os.path.exists(path):
+            return default
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_children(self, note_id):
+        """Возвращает содержимое корневой заметки при первом входе в нее (из ее шарда)."""
+        if note_id not in self._pending:
+            return []
+        self._pending.discard(note_id)
+        children = self._read_shard(note_id, {"children": []})["children"]
+        for item in iter_tree(children):
+            self._shard_of[item["id"]] = note_id
+        return children
+
+    def ancestors(self, item_id):
+        """Возвращает id корневой заметки, в шарде которой лежит элемент (ее загрузка загружает и его)."""
+        root = self._shard_of.get(item_id)
+        if root is None:
+            root = self._find_shard(item_id)
+        return [root] if root not in (None, self.TASKS, item_id) else []
+
+    def _find_shard(self, item_id):
+        """Ищет элемент в еще не прочитанных шардах (каждый читается не больше одного раза).
+
+        Индексы загружаются из файлов без чтения шардов, поэтому, где лежит найденный
+        поиском элемент, становится известно только здесь.
+        """
+        for note_id in list(self._pending):
+            if note_id in self._scanned:
+                continue
+            self._scanned.add(note_id)
+            for item in iter_tree(self._read_shard(note_id, {"children": []})["children"]):
+                self._shard_of[item["id"]] = note_id
+            if item_id in self._shard_of:
+                return self._shard_of[item_id]
+        return None
+
+    def iter_items(self):
+        """Обходит все элементы, читая непрочитанные шарды по одному (для построения индексов)."""
+        for note_id, entry in self._entries.items():
+            yield entry
+            if note_id in self._pending:
+                children = self._read_shard(note_id, {"children": []})["children"]
+                for item in iter_tree(children):
+                    self._shard_of[item["id"]] = note_id
+                    yield item
+        yield from iter_tree(self._read_shard(self.TASKS, {"tasks": []})["tasks"])
+
+    def subtree_counts(self):
+        """Возвращает строки (id заметки, статус, приоритет, количество) для корневых заметок."""
+        for note_id, entry in self._entries.items():
+            for status, priority, count in entry.get("counts", ()):
+                yield note_id, status, priority, count
+
+    def stamp(self):
+        """Возвращает отметку о состоянии манифеста (он переписывается при любой записи)."""
+        path = self._path(self.MANIFEST)
+        if not os.path.exists(path):
+            return [0, 0]
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def record(self, op):
+        """Помечает измененным шард, которого касается операция."""
+        kind = op["op"]
+        if kind == "add":
+            item = op["item"]
+            if op["parent"] is not None:
+                key = self._shard_of[op["parent"]]
+            elif item["type"] == "note":
+                key = item["id"]
+                self._removed.discard(key)
+            else:
+                key = self.TASKS
+            for node in iter_tree([item]):
+                self._shard_of[node["id"]] = key
+            self._dirty.add(key)
+        elif kind == "edit":
+            self._dirty.add(self._shard_of[op["id"]])
+        elif kind == "delete":
+            key = self._shard_of.pop(op["id"])
+            if key == op["id"]:  # Корневая заметка: удаляется весь шард
+                self._dirty.discard(key)
+                self._pending.discard(key)
+                self._entries.pop(key, None)
+                self._removed.add(key)
+            else:
+                self._dirty.add(key)
+
+    def commit(self, snapshot):
+        """Переписывает измененные шарды и манифест."""
+        if not self._batch:
+            self._write_dirty(snapshot)
+
+    def begin_batch(self):
+        """Начинает пакет изменений: шарды будут записаны один раз в end_batch."""
+        self._batch = True
+
+    def end_batch(self, snapshot):
+        """Завершает пакет изменений, переписывая измененные за него шарды."""
+        self._batch = False
+        self._write_dirty(snapshot)
+
+    def _write_file(self, name, data):
+        """Атомарно записывает файл каталога. Возвращает его контрольную сумму."""
+        started = time.perf_counter()
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        serialized = time.perf_counter()
+        stats = atomic_write(self._path(name), payload, generations=1)
+        stats["serialize"] = serialized - started
+        if self.on_write is not None:
+            self.on_write(stats)
+        return hashlib.sha256(payload).hexdigest()
+
+    def _write_note(self, note):
+        """Записывает шард корневой заметки (словарь с вложенными) и обновляет ее запись манифеста."""
+        entry = {key: value for key, value in note.items() if key != "children"}
+        entry["shard"] = self._shard_name(note["id"])
+        entry["checksum"] = self._write_file(entry["shard"], note)
+        entry["counts"] = shard_counts(note)
+        self._entries[note["id"]] = entry
+
+    def _write_dirty(self, snapshot):
+        if not (self._dirty or self._removed):
+            return
+        for key in self._dirty:
+            if key == self.TASKS:
+                self._tasks_checksum = self._write_file(self._shard_name(key), {"tasks": snapshot.tasks()})
+                continue
+            note = snapshot.note(key)
+            if key in self._pending:
+                # Изменились только поля заметки: содержимое берется из ее шарда
+                note["children"] = self._read_shard(key, {"children": []})["children"]
+            self._write_note(note)
+        self._write_manifest(snapshot.note_ids())
+        self._remove_shards(self._removed)
+        self._dirty.clear()
+        self._removed.clear()
+
+    def _remove_shards(self, keys):
+        """Удаляет шарды заметок вместе с резервными копиями.
+
+        Вызывается только после записи манифеста: сбой до этого места оставляет лишние
+        файлы, но манифест никогда не ссылается на удаленный шард.
+        """
+        for key in keys:
+            for suffix in ("", ".1"):
+                path = self._path(self._shard_name(key)) + suffix
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write_manifest(self, note_ids):
+        entries = [self._entries[note_id] for note_id in note_ids]
+        self._entries = {entry["id"]: entry for entry in entries}
+        self._write_file(self.MANIFEST, {"version": 1, "notes": entries, "tasks_checksum": self._tasks_checksum})
+
+    def save(self, data):
+        """Полностью перезаписывает каталог данными из памяти."""
+        stale = (set(self._entries) | self._removed) - {note["id"] for note in data["notes"]}
+        self._entries = {}
+        for note in data["notes"]:
+            self._write_note(note)
+        self._tasks_checksum = self._write_file(self._shard_name(self.TASKS), {"tasks": data["tasks"]})
+        self._write_manifest([note["id"] for note in data["notes"]])
+        self._remove_shards(stale)
+        self._pending.clear()
+        self._dirty.clear()
+        self._removed.clear()
+        self._shard_of = {}
+        for note in data["notes"]:
+            for item in iter_tree([note]):
+                self._shard_of[item["id"]] = note["id"]
+        for item in iter_tree(data["tasks"]):
+            self._shard_of[item["id"]] = self.TASKS
+
+    def close(self):
+        """Шарды записываются при каждом commit, закрывать нечего."""
+
+
+def migrate_json_to_sqlite(json_path, journal_path, db_path):
+    """Переносит данные из JSON-файла (с учетом журнала) в базу SQLite. Возвращает число элементов."""
+    data = JsonStorage(json_path, journal_path).load()
+    db = SqliteStorage(db_path)
+    db.save(data)
+    db.close()
+    return sum(1 for _ in iter_tree(data["notes"] + data["tasks"]))
+
+
+def migrate_json_to_shards(json_path, journal_path, directory):
+    """Переносит данные из JSON-файла (с учетом журнала) в каталог шардов. Возвращает число элементов."""
+    data = JsonStorage(json_path, journal_path).load()
+    ShardedStorage(directory).save(data)
+    return sum(1 for _ in iter_tree(data["notes"] + data["tasks"]))
+
+
+def unused_path(path):
+    """Возвращает path или, если такой файл уже есть, path.1, path.2, ... - первый свободный."""
+    candidate, number = path, 0
+    while os.path.exists(candidate):
+        number += 1
+        candidate = f"{path}.{number}"
+    return candidate
+
+
+def recovered_path(path):
+    """Имя файла для спасенных из path данных: notes.json -> notes.recovered.ndjson."""
+    return os.path.splitext(path)[0] + ".recovered.ndjson"
+
+
+def salvage_file(path, output_path):
+    """Спасает элементы из поврежденного снимка path в output_path (NDJSON, как при выгрузке).
+
+    Файл path не меняется. Печатает отчет о спасенном и потерянном и возвращает его
+    (recovery.Report).
+    """
+    salvage = Salvage(path)
+    write_ndjson(salvage.records(), output_path)
+    for line in salvage.report.lines():
+        print(line)
+    print(f"Спасенные данные записаны в {output_path}.")
+    return salvage.report
+
+
+def write_ndjson(records, path, append=False):
+    """Записывает записи в файл по одной на строку. Возвращает число записей."""
+    count = 0
+    with open(path, "a" if append else "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_ndjson(path):
+    """Читает записи из файла по одной строке, не загружая файл целиком."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Предупреждение: Строка {line_number} в {path} повреждена и пропущена.")
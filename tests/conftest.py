@@ -0,0 +1,21 @@
+import pytest
+
+import note
+from history import History
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Рабочий каталог теста: note.py пишет файлы данных относительно текущего каталога."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def app(workdir, monkeypatch):
+    """note.py с чистой историей и синхронной записью снимков."""
+    monkeypatch.setattr(note, "SAVE_DELAY", None)
+    monkeypatch.setattr(note, "history", History(note.UNDO_BUDGET))
+    yield note
+    if note._storage is not None:
+        note.close_storage()
@@ -0,0 +1,36 @@
+"""Общие функции тестов: сессия note.py поверх выбранного хранилища."""
+import note
+
+BACKENDS = ("json", "sqlite", "sharded")
+
+
+def start(backend):
+    """Открывает хранилище, загружает данные и возвращает сессию."""
+    note.open_storage(backend)
+    return note.Session(note.load_data())
+
+
+def run(session, *lines):
+    """Выполняет команды в сессии."""
+    for line in lines:
+        assert note.execute_command(session, line)
+
+
+def titles(data):
+    """Дерево заголовков со всеми вложенными элементами (непрочитанные дочитываются)."""
+    def level(items):
+        result = []
+        for item in items:
+            if item.type == "note":
+                note.load_children(item)
+                result.append((item.title, level(item.children)))
+            else:
+                result.append(item.title)
+        return result
+    return {"notes": level(data["notes"]), "tasks": level(data["tasks"])}
+
+
+def reopen(backend):
+    """Закрывает хранилище и загружает данные заново (как новый запуск)."""
+    note.close_storage()
+    return start(backend)
@@ -0,0 +1,49 @@
+import pytest
+
+from model import (Note, Priority, Status, Task, data_from_layout, data_to_layout, is_item_record, iter_records,
+                   record_to_item)
+
+
+def layout():
+    task = {"id": "t1", "type": "task", "title": "задача", "description": "описание", "status": "в процессе",
+            "priority": "высокий"}
+    inner = {"id": "n2", "type": "note", "title": "вложенная", "content": "", "status": "ожидает",
+             "priority": "низкий", "children": [task]}
+    outer = {"id": "n1", "type": "note", "title": "заметка", "content": "текст", "status": "выполнено",
+             "priority": "средний", "children": [inner]}
+    root_task = {"id": "t2", "type": "task", "title": "корневая", "description": "", "status": "отменено",
+                 "priority": "средний"}
+    return {"notes": [outer], "tasks": [root_task]}
+
+
+def test_layout_round_trip():
+    data = data_from_layout(layout())
+    outer = data["notes"][0]
+    task = outer.children[0].children[0]
+    assert isinstance(outer, Note) and isinstance(task, Task)
+    assert outer.status is Status.DONE and task.priority is Priority.HIGH
+    assert data_to_layout(data) == layout()
+
+
+def test_records_round_trip():
+    data = data_from_layout(layout())
+    records = list(iter_records(data["notes"]))
+    assert [(record["id"], record["parent"], record["depth"]) for record in records] == [
+        ("n1", None, 0), ("n2", "n1", 1), ("t1", "n2", 2)]
+    items = [record_to_item(record) for record in records]
+    assert [item.id for item in items] == ["n1", "n2", "t1"]
+    assert all(item.type != "note" or item.children == [] for item in items)
+    assert all(is_item_record(record) for record in records)
+
+
+def test_unknown_labels_fall_back_to_defaults():
+    item = record_to_item({"id": "x", "type": "task", "title": "t", "status": "???"})
+    assert item.status is Status.TODO and item.priority is Priority.MEDIUM and item.description == ""
+
+
+def test_items_have_no_attribute_dict():
+    task = Task("t")
+    with pytest.raises(AttributeError):
+        task.extra = 1
+    assert not hasattr(Note("n"), "__dict__")
+    assert Status.from_label("в процессе").label == "в процессе"
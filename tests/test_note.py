@@ -0,0 +1,252 @@
+import json
+import os
+
+import pytest
+
+from tests.helpers import BACKENDS, reopen, run, start, titles
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_export_import_merges_into_existing_notes(app, backend):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+t a x", "+t b y", "..", "export out.ndjson", "v 1", "d 1", "..")
+    assert titles(session.data)["notes"] == [("A", ["b"])]
+
+    # A и b уже есть в дереве и пропускаются, a возвращается в A
+    run(session, "import out.ndjson")
+    session = reopen(backend)
+    assert titles(session.data)["notes"] == [("A", ["b", "a"])]
+
+
+def test_import_skips_records_that_are_not_items(app, capsys):
+    session = start("json")
+    lines = ['{"notes": [], "tasks": []}', "[1]", '"text"', '{"id": 5, "type": "note", "title": "x"}',
+             '{"id": "n1", "type": "file", "title": "x"}', '{"id": "t1", "type": "task", "title": "ok"}']
+    with open("in.ndjson", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    run(session, "import in.ndjson")
+    assert titles(session.data) == {"notes": [], "tasks": ["ok"]}
+    out = capsys.readouterr().out
+    assert "Загружено элементов: 1" in out
+    assert "не похожих на элементы: 5" in out
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_archive_leaves_archived_context(app, backend):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+t a z", "..", "e 1 status=выполнено", "v 1", "archive x.ndjson")
+    assert session.context is None
+    run(session, "+t t o")
+    session = reopen(backend)
+    assert titles(session.data) == {"notes": [], "tasks": ["t"]}
+    with open("x.ndjson", encoding="utf-8") as f:
+        assert [json.loads(line)["title"] for line in f] == ["A", "a"]
+
+
+@pytest.mark.parametrize("backend", ("sqlite", "sharded"))
+def test_lazy_aggregates_after_reload(app, backend):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+t a x", "+t b y", "+t c z",
+        "e 1 priority=низкий", "e 2 status=выполнено", "e 3 priority=высокий")
+    expected = list(app.subtree_counts[session.context.id])
+    session = reopen(backend)
+    note_id = session.data["notes"][0].id
+    assert app.subtree_counts[note_id] == expected
+    # Дальнейшие правки считаются от прочитанной сводки
+    run(session, "v 1", "e 1 priority=средний")
+    session = reopen(backend)
+    counts = app.subtree_counts[note_id]
+    assert min(counts) >= 0
+    assert counts[len(app.Status) + app.Priority.LOW] == 0
+    assert counts[len(app.Status) + app.Priority.MEDIUM] == 2
+    assert counts[len(app.Status) + app.Priority.HIGH] == 1
+
+
+def test_sqlite_aggregates_are_not_recounted_at_startup(app, monkeypatch):
+    session = start("sqlite")
+    run(session, "+n A", "v 1", "+n B", "v 1", "+t a x", "+t b y")
+    expected = {note_id: list(counts) for note_id, counts in app.subtree_counts.items()}
+    recounts = []
+    recount = app.SqliteStorage.subtree_counts
+    monkeypatch.setattr(app.SqliteStorage, "subtree_counts", lambda self: recounts.append(1) or recount(self))
+
+    reopen("sqlite")
+    assert app.subtree_counts == expected and not recounts
+
+    # Сводки, сохраненные для другого состояния базы, не используются
+    app.close_storage()
+    with open(app.SUBTREE_COUNTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"stamp": [0, 0], "size": app.COUNTS_SIZE, "counts": {}}, f)
+    start("sqlite")
+    assert app.subtree_counts == expected and recounts
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_filter_whole_tree_and_here(app, backend, capsys):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+n B", "v 1", "+t x d", "e 1 priority=высокий", "..", "+t y d", "..", "..",
+        "+n C", "v 2", "+n D", "v 1", "+t z d", "e 1 priority=высокий", "..", "..", "..")
+    session = reopen(backend)
+    capsys.readouterr()
+
+    run(session, "v 1", "f priority=высокий here")
+    out = capsys.readouterr().out
+    assert "Найдено: 1" in out and "A / B / x" in out
+    # Совпадения вне текущей заметки не дочитываются
+    other = next(item for item in session.data["notes"] if item.title == "C")
+    assert backend == "json" or other.id in app._storage._pending
+
+    run(session, "..", "f priority=высокий type=задача")
+    out = capsys.readouterr().out
+    assert "Найдено: 2" in out and "A / B / x" in out and "C / D / z" in out
+
+    run(session, "v 1")
+    run(session, "f status=выполнено here")
+    assert "Ничего не найдено." in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("stop", (EOFError, KeyboardInterrupt))
+def test_interactive_exit_on_end_of_input_saves_data(app, monkeypatch, stop):
+    monkeypatch.setattr(app, "SAVE_DELAY", 60)  # Снимок остается отложенным до выхода
+    lines = iter(["+t a x"])
+
+    def fake_input(prompt):
+        line = next(lines, None)
+        if line is None:
+            raise stop
+        return line
+
+    monkeypatch.setattr("builtins.input", fake_input)
+    monkeypatch.setattr("sys.argv", ["note.py"])
+    app.main()
+    assert app._storage is None
+    # Хранилище закрыто: индексы записаны
+    assert os.path.exists(app.SEARCH_INDEX_FILE) and os.path.exists(app.ATTRIBUTE_INDEX_FILE)
+    session = start("json")
+    assert titles(session.data)["tasks"] == ["a"]
+
+
+def test_journal_replay_after_crash(app):
+    session = start("json")
+    run(session, "+n A", "v 1", "+t a x", "..", "+t b y")
+    # Сбой: процесс завершился без close_storage, последняя запись журнала оборвана
+    with open(app.JOURNAL_FILE, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "parent": null, "item": {"id": "')
+    app._storage = None
+    session = start("json")
+    assert titles(session.data) == {"notes": [("A", ["a"])], "tasks": ["b"]}
+
+
+def test_journal_replay_is_idempotent(app):
+    session = start("json")
+    run(session, "+t a x", "+t b y", "d 1")
+    app._storage.save(app.data_to_layout(session.data))
+    # Сбой между записью снимка и очисткой журнала: операции применяются повторно
+    with open(app.JOURNAL_FILE, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "add", "parent": None, "item": app.item_to_dict(session.data["tasks"][0])}) + "\n")
+    app._storage = None
+    session = start("json")
+    assert titles(session.data) == {"notes": [], "tasks": ["b"]}
+
+
+def test_paging(app, monkeypatch, capsys):
+    monkeypatch.setattr(app, "PAGE_SIZE", 3)
+    session = start("json")
+    run(session, *[f"+t t{i} x" for i in range(7)])
+    capsys.readouterr()
+
+    app.display_screen(session)
+    out = capsys.readouterr().out
+    assert "Страница 1 из 3" in out and "3. " in out and "4. " not in out
+    run(session, ">", ">", ">")
+    assert "Это последняя страница." in capsys.readouterr().out
+    app.display_screen(session)
+    out = capsys.readouterr().out
+    assert "Страница 3 из 3" in out and "7. " in out and "6. " not in out
+    run(session, "<", "<", "<")
+    assert "Это первая страница." in capsys.readouterr().out
+
+    # Страница, которой больше нет, сменяется последней
+    run(session, ">", ">", *["d 1"] * 4)
+    app.display_screen(session)
+    assert "Страница" not in capsys.readouterr().out and session.page == 0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_render_cache_follows_changes(app, backend, capsys):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+t a x", "..", "+t b y")
+    app.display_screen(session)
+    rows = app.render_cache["tasks"][1]
+    app.display_screen(session)
+    assert app.render_cache["tasks"][1] is rows  # Уровень без изменений не перерисовывается
+
+    run(session, "e 2 title=b2", "v 1", "e 1 status=выполнено", "..")
+    capsys.readouterr()
+    app.display_screen(session)
+    out = capsys.readouterr().out
+    assert " b2 " in out and " b " not in out
+    # Сводка заметки A пересчитана после правки вложенной задачи
+    assert app.render_cache["notes"][1][0].endswith(app.format_counts(app.subtree_counts[session.data["notes"][0].id]))
+
+
+def test_batch_mode_saves_once(app, monkeypatch, capsys):
+    with open("commands.txt", "w", encoding="utf-8") as f:
+        f.write("# Сценарий\n+n A\nv 1\n" + "".join(f"+t t{i} x\n" for i in range(20)) + "..\n\n+t b y\n")
+    writes = []
+    write_file = app.JsonStorage._write_file
+    monkeypatch.setattr(app.JsonStorage, "_write_file", lambda self, data: writes.append(1) or write_file(self, data))
+    monkeypatch.setattr("sys.argv", ["note.py", "--batch", "commands.txt", "--quiet"])
+    app.main()
+
+    assert len(writes) == 1
+    assert not os.path.exists(app.JOURNAL_FILE) or os.path.getsize(app.JOURNAL_FILE) == 0
+    out = capsys.readouterr().out
+    assert "Выполнено команд: 24" in out and "добавлена" not in out
+    session = start("json")
+    assert titles(session.data) == {"notes": [("A", [f"t{i}" for i in range(20)])], "tasks": ["b"]}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_undo_redo_persist(app, backend):
+    session = start(backend)
+    run(session, "+n A", "v 1", "+t a x", "+t b y", "..", "d 1")
+    assert titles(session.data)["notes"] == []
+
+    run(session, "u")
+    session = reopen(backend)
+    assert titles(session.data)["notes"] == [("A", ["a", "b"])]
+
+    run(session, "v 1", "d 1", "u", "r")
+    session = reopen(backend)
+    assert titles(session.data)["notes"] == [("A", ["b"])]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_undo_restores_position(app, backend):
+    session = start(backend)
+    run(session, "+t a x", "+t b y", "+t c z", "d 2", "u")
+    session = reopen(backend)
+    assert titles(session.data)["tasks"] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_undo_leaves_removed_context(app, backend):
+    session = start(backend)
+    run(session, "+n A", "v 1", "u")
+    assert session.context is None
+    run(session, "+t t o")
+    session = reopen(backend)
+    assert titles(session.data) == {"notes": [], "tasks": ["t"]}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_over_budget_step_clears_history(app, backend):
+    app.history.budget = 5
+    session = start(backend)
+    run(session, "+n N", "v 1", *[f"+t a{i} x" for i in range(6)], "d 1", "..", "d 1", "u")
+    assert titles(session.data)["notes"] == []
+    assert app.items_by_id == {}
+    assert app.search_index.search("a0") == set()
+    session = reopen(backend)
+    assert titles(session.data)["notes"] == []
@@ -0,0 +1,18 @@
+from profiling import Profiler, percentile
+from tests.helpers import run, start
+
+
+def test_percentile_nearest_rank():
+    assert percentile([1, 2], 50) == 1
+    assert percentile(list(range(1, 11)), 90) == 9
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([5], 1) == 5
+
+
+def test_parent_phase_times_only_going_up(app, monkeypatch):
+    monkeypatch.setattr(app, "profiler", Profiler())
+    session = start("json")
+    run(session, "+n A", "v 1", "+n B", "v 1", "+t a x", "..", "v 1", ".. 2")
+    app.display_screen(session)
+    assert len(app.profiler.samples["parent"]) == 2
+    assert "Фаза" in app.profiler.report()[0]
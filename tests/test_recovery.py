@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from recovery import Salvage, layout_from_records
+from snapshots import encode
+from storage import JsonStorage, iter_tree
+
+
+def sample_layout(count=50):
+    notes = []
+    for i in range(count):
+        tasks = [{"id": f"t{i}.{j}", "type": "task", "title": f"задача {i}.{j} \"в кавычках\" \\",
+                  "description": "описание", "status": "в процессе", "priority": "низкий"} for j in range(3)]
+        inner = {"id": f"s{i}", "type": "note", "title": f"вложенная {i}", "content": "текст",
+                 "status": "ожидает", "priority": "высокий", "children": tasks}
+        notes.append({"id": f"n{i}", "type": "note", "title": f"заметка {i}", "content": "x",
+                      "status": "выполнено", "priority": "средний", "children": [inner]})
+    tasks = [{"id": "root", "type": "task", "title": "корневая", "description": "",
+              "status": "к выполнению", "priority": "средний"}]
+    return {"notes": notes, "tasks": tasks}
+
+
+def salvage(path, chunk_size=4096):
+    scanner = Salvage(str(path), chunk_size=chunk_size)
+    return layout_from_records(scanner.records()), scanner.report
+
+
+def parents(layout):
+    """id элемента -> id родителя."""
+    result = {}
+    for item in iter_tree(layout["notes"] + layout["tasks"]):
+        result.setdefault(item["id"], None)
+        for child in item.get("children", ()):
+            result[child["id"]] = item["id"]
+    return result
+
+
+@pytest.mark.parametrize("codec", ("pretty", "compact", "binary"))
+def test_salvage_intact_file(tmp_path, codec):
+    layout = sample_layout()
+    path = tmp_path / "notes.json"
+    path.write_bytes(encode(layout, codec))
+    recovered, report = salvage(path)
+    assert recovered == layout
+    assert report.damage_count == 0 and not report.truncated and report.partial == 0
+
+
+@pytest.mark.parametrize("codec", ("pretty", "compact", "binary"))
+def test_salvage_truncated_file(tmp_path, codec):
+    layout = sample_layout()
+    payload = encode(layout, codec)
+    path = tmp_path / "notes.json"
+    path.write_bytes(payload[:len(payload) // 2])
+    recovered, report = salvage(path)
+    expected = parents(layout)
+    found = parents(recovered)
+    # Спасена примерно половина элементов, и каждый - на своем месте
+    assert len(found) >= len(expected) * 2 // 5
+    assert all(expected[item_id] == parent for item_id, parent in found.items())
+    assert report.notes + report.tasks == len(found)
+
+
+@pytest.mark.parametrize("codec", ("pretty", "compact", "binary"))
+def test_salvage_garbage_in_the_middle(tmp_path, codec):
+    layout = sample_layout()
+    payload = encode(layout, codec)
+    middle = len(payload) // 2
+    path = tmp_path / "notes.json"
+    path.write_bytes(payload[:middle] + b'}]{"\x00\xff garbage [[' + payload[middle + 40:])
+    recovered, report = salvage(path)
+    expected = parents(layout)
+    found = parents(recovered)
+    assert len(found) >= len(expected) - 5
+    misplaced = sum(1 for item_id, parent in found.items() if expected.get(item_id, parent) != parent)
+    assert misplaced <= 5
+    assert report.damage_count > 0
+
+
+def test_salvage_does_not_depend_on_chunk_size(tmp_path):
+    path = tmp_path / "notes.json"
+    path.write_bytes(encode(sample_layout(), "pretty"))
+    assert salvage(path, chunk_size=7)[0] == salvage(path, chunk_size=1 << 20)[0]
+
+
+def test_load_snapshot_keeps_damaged_file(tmp_path, capsys):
+    path = tmp_path / "notes.json"
+    payload = encode(sample_layout(), "pretty")
+    path.write_bytes(payload[:len(payload) // 2])
+    data = JsonStorage(str(path), generations=0).load()
+
+    assert (tmp_path / "notes.json.damaged").read_bytes() == payload[:len(payload) // 2]
+    assert (tmp_path / "notes.recovered.ndjson").exists()
+    assert data["notes"]
+    # Спасенные данные сразу записаны как новый снимок
+    assert JsonStorage(str(path), generations=0).load() == data
+    assert "Спасено элементов" in capsys.readouterr().out
+
+
+def test_load_snapshot_prefers_intact_backup(tmp_path):
+    path = tmp_path / "notes.json"
+    storage = JsonStorage(str(path), generations=2)
+    first = sample_layout(2)
+    storage.save(first)
+    storage.save(sample_layout(3))
+    path.write_bytes(b"{broken")
+    assert JsonStorage(str(path), generations=2).load() == first
+    assert os.path.exists(tmp_path / "notes.json.damaged")
+    assert not os.path.exists(tmp_path / "notes.recovered.ndjson")
+
+
+def test_salvage_compact_file_with_early_damage(tmp_path):
+    layout = sample_layout(500)
+    payload = encode(layout, "compact")
+    path = tmp_path / "notes.json"
+    # Кавычка с закрывающей кавычкой, но без : , } ] после нее - в начале файла в одну строку
+    path.write_bytes(payload[:100] + b'"stray"x' + payload[100:])
+    sizes = []
+
+    class Recording(Salvage):
+        def _tokens(self, buffer, base, final):
+            sizes.append(len(buffer))
+            return super()._tokens(buffer, base, final)
+
+    scanner = Recording(str(path), chunk_size=4096)
+    recovered = parents(layout_from_records(scanner.records()))
+    assert max(sizes) <= 2 * 4096
+    assert len(recovered) >= len(parents(layout)) - 5
+    assert scanner.report.damage_count > 0
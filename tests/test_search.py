@@ -0,0 +1,47 @@
+from search import SearchIndex
+from tests.helpers import reopen, run, start
+
+
+def test_search_build_matches_incremental_add():
+    documents = [(str(i), f"слово{i} общее w{i % 13}") for i in range(2000)]
+    built = SearchIndex.build(documents)
+    added = SearchIndex()
+    for item_id, text in documents:
+        added.add(item_id, text)
+    assert built.postings == added.postings
+    assert built.doc_tokens == added.doc_tokens
+    assert built.vocabulary == added.vocabulary
+    assert built.search("слово199") == {"199", "1990", "1991", "1992", "1993", "1994", "1995", "1996", "1997",
+                                        "1998", "1999"}
+
+
+def test_search_by_prefixes_and_yo():
+    index = SearchIndex.build([("1", "Зелёный чай"), ("2", "Зеленая папка"), ("3", "Черный чай")])
+    assert index.search("зел") == {"1", "2"}
+    assert index.search("ЗЕЛЕН") == {"1", "2"}
+    assert index.search("зелёная") == {"2"}
+    assert index.search("зел ча") == {"1"}
+    assert index.search("синий") == set()
+    assert index.search("") == set()
+
+
+def test_search_follows_edits_and_removal():
+    index = SearchIndex()
+    index.add("1", "старый текст")
+    index.add("1", "новый текст")
+    assert index.search("стар") == set()
+    assert index.search("нов") == {"1"}
+    index.remove("1")
+    assert index.search("текст") == set()
+    assert index.vocabulary == [] and index.postings == {}
+
+
+def test_search_command_after_reload(app, capsys):
+    session = start("sqlite")
+    run(session, "+n Ёлка", "v 1", "+t игрушки шары и гирлянды", "..")
+    session = reopen("sqlite")
+    capsys.readouterr()
+    run(session, "s елк")
+    assert "Найдено: 1" in capsys.readouterr().out
+    run(session, "s гирл")
+    assert "Ёлка / игрушки" in capsys.readouterr().out
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import pytest
+
+import server
+from tests.helpers import start
+
+pytestmark = pytest.mark.skipif(not server.available(), reason="нет Unix-сокетов")
+
+
+@pytest.fixture
+def serving(app):
+    """Сервер note.py в фоновом потоке; возвращает функцию подключения клиента."""
+    session = start("json")
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        listener = loop.run_until_complete(asyncio.start_unix_server(
+            lambda reader, writer: server.handle_client(session.data, reader, writer), app.SOCKET_FILE))
+        ready.set()
+        loop.run_forever()
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    ready.wait()
+    clients = []
+
+    def connect():
+        client = server.Client(server.connect(app.SOCKET_FILE))
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_clients_share_data_but_not_position(serving):
+    first, second = serving(), serving()
+    reply = first.request(command="+n A")
+    assert reply["running"] and "Заметка 'A' добавлена." in reply["output"]
+    assert "Вы находитесь в заметке: A" in first.request(command="v 1")["output"]
+    assert "1. " in second.request(screen=True)["output"]
+    assert second.request(item="1") == {"type": "note", "status": "к выполнению", "priority": "средний"}
+
+    # Второй клиент удаляет заметку, в которой находится первый
+    second.request(command="d 1")
+    reply = first.request(screen=True)
+    assert "удалена другим клиентом" in reply["output"] and "Корневой уровень" in reply["output"]
+    assert second.request(command="q")["running"] is False
+
+
+def test_bad_request_gets_an_error(serving):
+    client = serving()
+    client.stream.write(b"not json\n")
+    client.stream.flush()
+    assert "Некорректный запрос" in client.stream.readline().decode("utf-8")
+    assert client.request(screen=True)["running"]
@@ -0,0 +1,50 @@
+import pytest
+
+from snapshots import CODECS, available_codecs, decode, encode, read_root_item
+from storage import JsonStorage
+
+
+def sample_layout():
+    task = {"id": "t1", "type": "task", "title": "задача \"в кавычках\"", "description": "", "status": "в процессе",
+            "priority": "высокий"}
+    notes = [{"id": f"n{i}", "type": "note", "title": f"заметка {i}", "content": "текст", "status": "ожидает",
+              "priority": "низкий", "children": [dict(task, id=f"t{i}.1")]} for i in range(3)]
+    return {"notes": notes, "tasks": [task]}
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_codec_round_trip(codec):
+    if codec not in available_codecs():
+        with pytest.raises(ValueError):
+            encode(sample_layout(), codec)
+        return
+    assert decode(encode(sample_layout(), codec)) == sample_layout()
+
+
+def test_binary_reads_one_root_item(tmp_path):
+    path = tmp_path / "notes.json"
+    path.write_bytes(encode(sample_layout(), "binary"))
+    assert read_root_item(str(path), "n1") == sample_layout()["notes"][1]
+    assert read_root_item(str(path), "t1") == sample_layout()["tasks"][0]
+    assert read_root_item(str(path), "нет") is None
+
+
+def test_damaged_binary_raises_value_error():
+    payload = encode(sample_layout(), "binary")
+    with pytest.raises(ValueError):
+        decode(payload[:-3])
+    with pytest.raises(ValueError):
+        encode(sample_layout(), "xml")
+
+
+@pytest.mark.parametrize("written", available_codecs())
+@pytest.mark.parametrize("codec", available_codecs())
+def test_storage_reads_any_format(tmp_path, written, codec):
+    path = str(tmp_path / "notes.json")
+    JsonStorage(path, codec=written).save(sample_layout())
+    # Формат определяется по содержимому файла, а не по настройке хранилища
+    storage = JsonStorage(path, codec=codec)
+    assert storage.load() == sample_layout()
+    storage.save(sample_layout())
+    with open(path, "rb") as f:
+        assert f.read() == encode(sample_layout(), codec)
@@ -0,0 +1,142 @@
+import os
+import time
+
+import pytest
+
+from storage import BackgroundSaver, ShardedStorage, SqliteStorage, new_id, verify_shard
+
+
+def task(title, status="к выполнению", priority="средний"):
+    return {"id": new_id(), "type": "task", "title": title, "description": "", "status": status, "priority": priority}
+
+
+def note(title, children=()):
+    return {"id": new_id(), "type": "note", "title": title, "content": "", "status": "к выполнению",
+            "priority": "средний", "children": list(children)}
+
+
+class Snapshot:
+    """Снимок для commit хранилища поверх готовых данных."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __call__(self):
+        return self.data
+
+    def note(self, note_id):
+        return dict(next(note for note in self.data["notes"] if note["id"] == note_id))
+
+    def tasks(self):
+        return self.data["tasks"]
+
+    def note_ids(self):
+        return [note["id"] for note in self.data["notes"]]
+
+
+def test_sharded_restore_refreshes_manifest(tmp_path):
+    directory = str(tmp_path / "shards")
+    first = note("A", [task("a"), task("b")])
+    storage = ShardedStorage(directory)
+    storage.load()
+    storage.save({"notes": [first], "tasks": []})
+    second = dict(first, title="A2", children=first["children"] + [task("c")])
+    storage.save({"notes": [second], "tasks": []})  # Прежний шард остается копией .1
+
+    with open(os.path.join(directory, f"{first['id']}.json"), "w", encoding="utf-8") as f:
+        f.write("{broken")
+    storage = ShardedStorage(directory)
+    data = storage.load()
+    assert data["notes"][0]["title"] == "A"
+    assert sum(count for _, _, _, count in storage.subtree_counts()) == 2
+
+    # Исправленный манифест записан
+    storage = ShardedStorage(directory)
+    storage.load()
+    assert sum(count for _, _, _, count in storage.subtree_counts()) == 2
+
+
+def test_sharded_crash_before_manifest_keeps_removed_shard(tmp_path, monkeypatch):
+    directory = str(tmp_path / "shards")
+    first, second = note("A", [task("a")]), note("B", [task("b")])
+    storage = ShardedStorage(directory)
+    storage.load()
+    storage.save({"notes": [first, second], "tasks": []})
+
+    storage.record({"op": "delete", "id": first["id"]})
+    storage.record({"op": "edit", "id": second["id"], "fields": {"title": "B2"}})
+
+    def crash(self, note_ids):
+        raise OSError("сбой")
+
+    monkeypatch.setattr(ShardedStorage, "_write_manifest", crash)
+    with pytest.raises(OSError):
+        storage.commit(Snapshot({"notes": [dict(second, title="B2")], "tasks": []}))
+    monkeypatch.undo()
+
+    # Манифест остался прежним, и шард удаленной заметки по-прежнему на месте
+    storage = ShardedStorage(directory)
+    data = storage.load()
+    assert [fields["id"] for fields in data["notes"]] == [first["id"], second["id"]]
+    assert [child["title"] for child in storage.load_children(first["id"])] == ["a"]
+
+
+def test_verify_shard_keeps_every_damaged_copy(tmp_path):
+    path = str(tmp_path / "shard.json")
+    with open(path + ".1", "w", encoding="utf-8") as f:
+        f.write('{"children": []}')
+    for payload in ("{broken", "{broken again"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        assert verify_shard(path, "")[0] == "restored"
+    with open(path + ".damaged", encoding="utf-8") as f:
+        assert f.read() == "{broken"
+    with open(path + ".damaged.1", encoding="utf-8") as f:
+        assert f.read() == "{broken again"
+
+
+def test_saver_writes_under_a_steady_stream_of_changes():
+    written = []
+    saver = BackgroundSaver(lambda snapshot: written.append(snapshot()), delay=0.05, max_wait=0.2)
+    try:
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline and not written:
+            saver.schedule(lambda: "снимок")
+            time.sleep(0.01)
+        assert written
+    finally:
+        saver.stop()
+
+
+def test_sqlite_saves_deep_nesting(tmp_path):
+    root = node = note("корень")
+    for i in range(3000):
+        child = note(f"уровень {i}")
+        node["children"].append(child)
+        node = child
+    node["children"].append(task("лист"))
+    storage = SqliteStorage(str(tmp_path / "notes.db"))
+    storage.load()
+    storage.save({"notes": [root], "tasks": []})
+    assert sum(1 for _ in storage.iter_items()) == 3002
+    storage.close()
+
+
+def test_sqlite_loads_levels_on_demand(tmp_path):
+    inner = note("B", [task("b")])
+    outer = note("A", [task("a"), inner])
+    path = str(tmp_path / "notes.db")
+    storage = SqliteStorage(path)
+    storage.load()
+    storage.save({"notes": [outer], "tasks": [task("t")]})
+    storage.close()
+
+    storage = SqliteStorage(path)
+    data = storage.load()
+    assert [fields["title"] for fields in data["notes"]] == ["A"] and data["notes"][0]["children"] == []
+    assert [fields["title"] for fields in data["tasks"]] == ["t"]
+    assert [fields["title"] for fields in storage.load_children(outer["id"])] == ["a", "B"]
+    assert storage.load_children(outer["id"]) == []  # Уровень читается один раз
+    assert storage.ancestors(inner["children"][0]["id"]) == [outer["id"], inner["id"]]
+    assert [fields["title"] for fields in storage.load_children(inner["id"])] == ["b"]
+    storage.close()